@@ -1,4 +1,34 @@
-from table import Table
-from tictoc import TicToc
-import util as skutil
-import common_mpi as mpi
+import sys
+import types
+import importlib
+
+from table import Table, Column
+from tictoc import TicToc, Progress
+
+__all__ = ['Table', 'Column', 'TicToc', 'Progress', 'skutil', 'mpi']
+
+# Submodules that are slow to import (common_mpi initializes MPI), imported
+# on first access of their name in the package.
+_lazy_submodules = {'skutil': 'util', 'mpi': 'common_mpi',
+                    'util': 'util', 'common_mpi': 'common_mpi'}
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Package module that imports _lazy_submodules on first attribute access.
+    """
+
+    def __getattr__(self, name):
+        if name not in _lazy_submodules:
+            raise AttributeError(
+                "'module' object has no attribute '%s'" % name)
+        module = importlib.import_module(
+            __name__ + '.' + _lazy_submodules[name])
+        setattr(self, name, module)
+        return module
+
+_module = _LazyModule(__name__, __doc__)
+_module.__dict__.update(sys.modules[__name__].__dict__)
+# keep the original module alive: its globals are cleared when it is freed
+_module._original_module = sys.modules[__name__]
+sys.modules[__name__] = _module
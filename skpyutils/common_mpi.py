@@ -1,17 +1,50 @@
 from mpi4py import MPI
 import time
+import numpy as np
+from skpyutils import util as skutil
+from skpyutils.table import Table
 
 comm = MPI.COMM_WORLD
 comm_rank = comm.Get_rank()
 comm_size = comm.Get_size()
 
 
-def safebarrier(comm=None, tag=0, sleep=0.01):
+def wait(requests, spin=1e-4, sleep=0.01):
+    """
+    Wait for MPI request(s) to complete without occupying a CPU while
+    waiting for long: poll continuously for spin seconds, then sleep between
+    polls, starting at 10 us and growing by 1.25x each time, up to sleep
+    seconds. (Doubling oversleeps by so much that, in back-to-back barriers,
+    the ranks keep waiting for each other.)
+
+    Args:
+      requests (MPI.Request or list): request(s) to wait for.
+
+      spin (float): [optional] seconds to poll before starting to sleep.
+
+      sleep (float): [optional] maximum seconds to sleep between polls.
+    """
+    if isinstance(requests, MPI.Request):
+        requests = [requests]
+    t_spin_end = time.time() + spin
+    backoff = 1e-5
+    while not MPI.Request.Testall(requests):
+        if time.time() > t_spin_end:
+            time.sleep(backoff)
+            backoff = min(1.25 * backoff, sleep)
+
+
+def safebarrier(comm=None, tag=0, sleep=0.01, spin=1e-4):
     """
     This is a better mpi barrier than MPI.comm.barrier(): the original barrier
     may cause idle processes to still occupy the CPU, while this barrier waits
     without occupying any CPU.
 
+    In each round of the dissemination pattern, waits for the message as in
+    wait(): when all ranks arrive together, every round completes while
+    polling, and ranks waiting for stragglers back off to sleeping up to
+    sleep seconds between polls. Messages are empty buffers, not pickles.
+
     Code by "Yanging Jia" <jiayq@icsi.berkeley.edu>
     """
     if comm is None:
@@ -20,13 +53,669 @@ def safebarrier(comm=None, tag=0, sleep=0.01):
     if size == 1:
         return
     rank = comm.Get_rank()
+    buf = bytearray(0)
     mask = 1
     while mask < size:
         dst = (rank + mask) % size
         src = (rank - mask + size) % size
-        req = comm.isend(None, dst, tag)
-        while not comm.Iprobe(src, tag):
-            time.sleep(sleep)
-        comm.recv(None, src, tag)
-        req.Wait()
+        reqs = [comm.Isend([buf, MPI.BYTE], dst, tag),
+                comm.Irecv([buf, MPI.BYTE], src, tag)]
+        wait(reqs, spin, sleep)
         mask <<= 1
+
+
+def safebcast(arr, root=0, comm=None, sleep=0.01, spin=1e-4):
+    """
+    Broadcast ndarray arr from root to all ranks, waiting as in
+    safebarrier(). Only the shape and dtype are pickled; the data is sent
+    from its buffer.
+
+    Args:
+      arr (ndarray): array to send on root; ignored on other ranks.
+
+    Returns:
+      arr (ndarray): the broadcast array, on all ranks.
+    """
+    return _bcast_array(arr, root, comm, sleep, spin)
+
+
+def safereduce(arr, op=MPI.SUM, root=0, comm=None, sleep=0.01, spin=1e-4):
+    """
+    Reduce ndarrays of the same shape and dtype from all ranks to root with
+    op, waiting as in safebarrier().
+
+    Returns:
+      On root, the reduced array; on other ranks, None.
+    """
+    return _reduce_array(arr, op, root, comm, sleep, spin)
+
+
+def safeallgather(arr, comm=None, sleep=0.01, spin=1e-4):
+    """
+    Gather ndarrays of the same shape and dtype from all ranks to all ranks,
+    waiting as in safebarrier().
+
+    Returns:
+      ndarray of shape (size,) + arr.shape, with the array of rank r at r.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    arr = np.asarray(arr, order='C')
+    result = np.empty((comm.Get_size(),) + arr.shape, dtype=arr.dtype)
+    if comm.Get_size() == 1 or arr.size == 0:
+        result[:] = arr
+        return result
+    # one datatype for the whole array, so that it can be over 2 GB; the
+    # receive count is per rank
+    arr_type = _row_type(arr.shape, arr.dtype)
+    wait(comm.Iallgather([arr, 1, arr_type], [result, 1, arr_type]),
+         spin, sleep)
+    arr_type.Free()
+    return result
+
+
+def collect(seq, func, kwargs=None, with_index=False, index_col_name=None,
+            schedule='static', chunksize=1, root=0, comm=None):
+    """
+    Distributed version of skutil.collect(): the items of seq are split among
+    the ranks of comm, and the outputs are gathered to root, in the order
+    of seq. Must be called by all ranks, with the same seq.
+
+    Args:
+      seq, func, kwargs, with_index, index_col_name: see skutil.collect().
+
+      schedule (string): [optional]
+        - 'static': rank r processes items r, r+size, r+2*size, ...
+        - 'dynamic': ranks take the next chunksize items from a shared
+          counter whenever they are done, which balances uneven item costs.
+          Root only serves the counter, and processes no items, so that
+          the other ranks never wait for it to finish an item.
+
+      chunksize (int): [optional] items taken at a time by 'dynamic'.
+
+      root (int): [optional] rank to gather the outputs to.
+
+      comm (MPI.Comm): [optional] defaults to MPI.COMM_WORLD.
+
+    Returns:
+      On root, the same as skutil.collect(); on other ranks, None.
+
+    Raises:
+      ValueError if schedule is not 'static' or 'dynamic'.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    if schedule not in ('static', 'dynamic'):
+        raise ValueError("schedule must be 'static' or 'dynamic'")
+    if comm.Get_size() == 1:
+        return skutil.collect(seq, func, kwargs, with_index, index_col_name)
+    seq = list(seq)
+    if schedule == 'static':
+        positions = xrange(comm.Get_rank(), len(seq), comm.Get_size())
+    else:
+        positions = _dynamic_positions(len(seq), chunksize, root, comm)
+
+    # run func locally, remembering the position in seq of each output row
+    local_results = skutil._RowBuffer()
+    row_positions = []
+    cols = None
+    for pos in positions:
+        results = skutil._call_with_kwargs(func, kwargs, seq[pos])
+        if isinstance(results, Table):
+            cols = results.cols
+            results = results.arr
+        if results.shape[0] > 0:
+            local_results.append(results)
+            row_positions.append(np.repeat(pos, np.atleast_2d(results).shape[0]))
+    arr = local_results.finish()
+    row_positions = np.hstack(row_positions).astype('int64') if \
+        row_positions else np.zeros(0, dtype='int64')
+
+    cols = ([c for c in comm.gather(cols, root) or [] if c] or [None])[0]
+    arr = gather_array(arr, root, comm)
+    row_positions = gather_array(row_positions, root, comm)
+    if comm.Get_rank() != root:
+        return None
+    if arr.size > 0:
+        order = np.argsort(row_positions, kind='mergesort')
+        arr = arr[order]
+        if with_index:
+            arr = np.hstack((arr, row_positions[order][:, np.newaxis]))
+    if cols:
+        if with_index:
+            assert(index_col_name)
+            cols = cols + [index_col_name]
+        arr = Table(arr, list(cols))
+    return arr
+
+
+def collect_with_index(seq, func, kwargs=None, index_col_name=None,
+                       schedule='static', chunksize=1, root=0, comm=None):
+    """
+    See collect().
+    """
+    return collect(seq, func, kwargs, True, index_col_name,
+                   schedule, chunksize, root, comm)
+
+
+def _row_type(row_shape, dtype):
+    """
+    Return committed MPI datatype for one row (of shape row_shape) of an
+    array of dtype, so that counts are in rows and arrays of more than 2 GB
+    can be sent. Must be Free()d.
+    """
+    row_bytes = int(np.prod(row_shape)) * np.dtype(dtype).itemsize
+    return MPI.BYTE.Create_contiguous(max(row_bytes, 1)).Commit()
+
+
+def bcast_array(arr, root=0, comm=None):
+    """
+    Broadcast ndarray arr from root to all ranks with Bcast.
+    Only the shape and dtype are pickled; the data is sent from its buffer.
+
+    Returns:
+      arr (ndarray): the broadcast array, on all ranks.
+    """
+    return _bcast_array(arr, root, comm)
+
+
+def _bcast_array(arr, root, comm, sleep=None, spin=None):
+    """
+    Helper to bcast_array() and safebcast(): with sleep, use Ibcast and
+    wait(), otherwise Bcast.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    if comm.Get_size() == 1:
+        return arr
+    if comm.Get_rank() == root:
+        arr = np.asarray(arr, order='C')
+        meta = (arr.shape, arr.dtype.str)
+    else:
+        meta = None
+    shape, dtype = comm.bcast(meta, root)
+    if comm.Get_rank() != root:
+        arr = np.empty(shape, dtype=dtype)
+    if arr.size > 0:
+        rows = np.atleast_1d(arr)
+        row_type = _row_type(rows.shape[1:], dtype)
+        buf = [rows, rows.shape[0], row_type]
+        if sleep is None:
+            comm.Bcast(buf, root)
+        else:
+            wait(comm.Ibcast(buf, root), spin, sleep)
+        row_type.Free()
+    return arr
+
+
+def scatter_array(arr, root=0, comm=None):
+    """
+    Split the rows of ndarray arr on root into contiguous parts of nearly
+    equal size, as np.array_split() does, and send part r to rank r with
+    Scatterv.
+
+    Returns:
+      ndarray with the rows of this rank's part.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    size = comm.Get_size()
+    if size == 1:
+        return arr
+    if comm.Get_rank() == root:
+        arr = np.ascontiguousarray(arr)
+        meta = (arr.shape, arr.dtype.str)
+    else:
+        meta = None
+    shape, dtype = comm.bcast(meta, root)
+    counts = np.array([len(x) for x in np.array_split(np.arange(shape[0]), size)])
+    displs = np.r_[0, np.cumsum(counts)[:-1]]
+    part = np.empty((counts[comm.Get_rank()],) + tuple(shape[1:]), dtype=dtype)
+    row_type = _row_type(shape[1:], dtype)
+    sendbuf = [arr, (counts, displs), row_type] if \
+        comm.Get_rank() == root else None
+    comm.Scatterv(sendbuf, [part, part.shape[0], row_type], root)
+    row_type.Free()
+    return part
+
+
+def gather_array(arr, root=0, comm=None):
+    """
+    Concatenate the rows of ndarrays from all ranks, in rank order, on root
+    with Gatherv. Empty arrays contribute no rows; the others must have the
+    same shape after the first axis, and are converted to their common dtype.
+    Only the shapes and dtypes are pickled.
+
+    Returns:
+      On root, the concatenated array, or np.array([]) if all arrays were
+      empty; on other ranks, None.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    arr = np.asarray(arr)
+    if comm.Get_size() == 1:
+        return arr if arr.size > 0 else np.array([])
+    num_rows = arr.shape[0] if arr.size > 0 else 0
+    meta = comm.gather((num_rows, arr.shape[1:], arr.dtype.str), root)
+    shape = dtype = counts = None
+    if comm.Get_rank() == root:
+        counts = np.array([m[0] for m in meta])
+        with_rows = [m for m in meta if m[0] > 0]
+        if with_rows:
+            shape = with_rows[0][1]
+            assert(all(m[1] == shape for m in with_rows))
+            dtype = np.result_type(*[np.dtype(m[2]) for m in with_rows]).str
+    shape, dtype = comm.bcast((shape, dtype), root)
+    if dtype is None:
+        return np.array([]) if comm.Get_rank() == root else None
+
+    if num_rows == 0:
+        arr = np.zeros((0,) + tuple(shape), dtype=dtype)
+    sendbuf = np.ascontiguousarray(arr, dtype=dtype)
+    row_type = _row_type(shape, dtype)
+    result = None
+    recvbuf = None
+    if comm.Get_rank() == root:
+        result = np.empty((counts.sum(),) + tuple(shape), dtype=dtype)
+        displs = np.r_[0, np.cumsum(counts)[:-1]]
+        recvbuf = [result, (counts, displs), row_type]
+    comm.Gatherv([sendbuf, num_rows, row_type], recvbuf, root)
+    row_type.Free()
+    return result
+
+
+def allreduce_array(arr, op=MPI.SUM, comm=None):
+    """
+    Reduce ndarrays of the same shape and dtype from all ranks with op,
+    using Allreduce, and return the result on all ranks.
+    """
+    return _reduce_array(arr, op, None, comm)
+
+
+def _reduce_array(arr, op, root, comm, sleep=None, spin=None):
+    """
+    Helper to allreduce_array() (if root is None) and safereduce(): with
+    sleep, use the nonblocking collective and wait(), otherwise the blocking
+    one. Reductions need the element datatype, so counts are in elements.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    arr = np.asarray(arr, order='C')
+    if comm.Get_size() == 1:
+        return arr.copy()
+    result = None
+    if root is None or comm.Get_rank() == root:
+        result = np.empty_like(arr)
+    if root is None:
+        if sleep is None:
+            comm.Allreduce(arr, result, op)
+        else:
+            wait(comm.Iallreduce(arr, result, op), spin, sleep)
+    elif sleep is None:
+        comm.Reduce(arr, result, op, root)
+    else:
+        wait(comm.Ireduce(arr, result, op, root), spin, sleep)
+    return result
+
+
+def bcast_table(table, root=0, comm=None):
+    """
+    Broadcast Table from root to all ranks: the array with bcast_array(),
+    and the cols, index and name as a pickled message.
+
+    Returns:
+      table (Table): the broadcast Table, on all ranks.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    if comm.Get_size() == 1:
+        return table
+    is_root = comm.Get_rank() == root
+    meta = comm.bcast(
+        (table.cols, table.index, table.name) if is_root else None, root)
+    arr = bcast_array(table.arr if is_root else None, root, comm)
+    return Table(arr, *meta)
+
+
+def scatter_table(table, root=0, comm=None):
+    """
+    Split the rows of Table on root among the ranks with scatter_array().
+    Each rank gets its part of the index; all get the cols and name.
+
+    Returns:
+      table (Table): this rank's part.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    if comm.Get_size() == 1:
+        return table
+    is_root = comm.Get_rank() == root
+    meta = None
+    if is_root:
+        index = table.index
+        if index:
+            bounds = np.cumsum([0] + [len(x) for x in np.array_split(
+                np.arange(len(index)), comm.Get_size())])
+            index = [index[bounds[r]:bounds[r + 1]]
+                     for r in range(comm.Get_size())]
+        meta = [(table.cols, index[r] if index else index, table.name)
+                for r in range(comm.Get_size())]
+    meta = comm.scatter(meta, root)
+    arr = scatter_array(table.arr if is_root else None, root, comm)
+    return Table(arr, *meta)
+
+
+def gather_table(table, root=0, comm=None):
+    """
+    Concatenate the rows of Tables from all ranks on root with
+    gather_array(). The index is concatenated if all Tables have one; the
+    cols and name are taken from root's Table.
+
+    Returns:
+      On root, the concatenated Table; on other ranks, None.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    if comm.Get_size() == 1:
+        return table
+    indices = comm.gather(table.index, root)
+    arr = gather_array(table.arr, root, comm)
+    if comm.Get_rank() != root:
+        return None
+    index = None
+    if all(rank_index is not None for rank_index in indices):
+        index = [name for rank_index in indices for name in rank_index]
+    return Table(arr, table.cols, index, table.name)
+
+
+def allreduce_table(table, op=MPI.SUM, comm=None):
+    """
+    Reduce the arrays of Tables of the same shape from all ranks with op,
+    with allreduce_array(), and return a Table with the result and the cols,
+    index and name of this rank's Table on all ranks.
+    """
+    return Table(allreduce_array(table.arr, op, comm),
+                 table.cols, table.index, table.name)
+
+
+def shared_table(table=None, loader=None, root=0, comm=None):
+    """
+    Return a Table whose array is held once per node, in MPI shared memory,
+    instead of once per rank. One rank per node (the node leader) fills the
+    shared array; all ranks on the node get read-only views of it.
+    Must be called by all ranks of comm.
+
+    Args:
+      table (Table): [optional] Table to share, given on root. Its array is
+        broadcast from root to the node leaders, directly into their shared
+        memory.
+
+      loader (function): [optional] if given instead of table, called with
+        no arguments by each node leader to load the Table itself.
+
+      root (int): [optional] rank that has table; it leads its node.
+
+      comm (MPI.Comm): [optional] defaults to MPI.COMM_WORLD.
+
+    Returns:
+      (table, win): the Table with the shared read-only array, and the MPI
+      window holding the memory. Call win.Free() on all ranks of comm when
+      done with the Table.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    key = 0 if rank == root else rank + 1
+    node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key=key)
+    is_leader = node_comm.Get_rank() == 0
+    leader_comm = comm.Split(0 if is_leader else MPI.UNDEFINED, key)
+
+    # the node leaders learn the shape, dtype and metadata of the Table
+    meta = None
+    if is_leader:
+        if loader is not None:
+            table = loader()
+        elif rank != root:
+            table = None
+        if table is not None:
+            arr = np.ascontiguousarray(table.arr)
+            meta = (arr.shape, arr.dtype.str, table.cols, table.index,
+                    table.name)
+        if loader is None:
+            meta = leader_comm.bcast(meta, 0)
+    meta = node_comm.bcast(meta, 0)
+    shape, dtype = meta[0], np.dtype(meta[1])
+
+    # one allocation per node; the other ranks map the leader's segment
+    num_bytes = int(np.prod(shape)) * dtype.itemsize
+    win = MPI.Win.Allocate_shared(num_bytes if is_leader else 0, 1,
+                                  comm=node_comm)
+    if num_bytes > 0:
+        buf = win.Shared_query(0)[0]
+        shared = np.frombuffer(buf, dtype=dtype,
+                               count=int(np.prod(shape))).reshape(shape)
+    else:
+        shared = np.empty(shape, dtype=dtype)
+    if is_leader and num_bytes > 0:
+        if loader is not None or rank == root:
+            shared[...] = arr
+        if loader is None:
+            rows = np.atleast_1d(shared)
+            row_type = _row_type(rows.shape[1:], dtype)
+            leader_comm.Bcast([rows, rows.shape[0], row_type], 0)
+            row_type.Free()
+    node_comm.Barrier()
+    shared.flags.writeable = False
+
+    if leader_comm != MPI.COMM_NULL:
+        leader_comm.Free()
+    node_comm.Free()
+    return (Table(shared, list(meta[2]) if meta[2] is not None else None,
+                  meta[3], meta[4]), win)
+
+
+def _dynamic_positions(n, chunksize, root, comm, sleep=0.001):
+    """
+    Helper to collect(): generator of positions in range(n), taken by this
+    rank chunksize at a time from a counter in an MPI window on root.
+    Must be exhausted by all ranks, as it frees the window at the end.
+
+    Root yields no positions: it polls the counter, sleeping up to sleep
+    seconds in between, which lets MPI serve the other ranks' requests,
+    until every other rank has taken its last, empty, chunk.
+    """
+    is_root = comm.Get_rank() == root
+    counter = np.zeros(1 if is_root else 0, dtype='int64')
+    win = MPI.Win.Create(counter, counter.itemsize, comm=comm)
+    increment = np.array([chunksize], dtype='int64')
+    start = np.zeros(1, dtype='int64')
+    try:
+        if is_root:
+            num_chunks = -(-n // chunksize) + comm.Get_size() - 1
+            backoff = 1e-5
+            while True:
+                win.Lock(root)
+                taken = counter[0]
+                win.Unlock(root)
+                if taken >= num_chunks * chunksize:
+                    return
+                time.sleep(backoff)
+                backoff = min(1.25 * backoff, sleep)
+        while True:
+            win.Lock(root)
+            win.Fetch_and_op(increment, start, root, 0, MPI.SUM)
+            win.Unlock(root)
+            if start[0] >= n:
+                break
+            for pos in xrange(start[0], min(start[0] + chunksize, n)):
+                yield pos
+    finally:
+        win.Free()
+
+
+_TAG_REQUEST = 101
+_TAG_TASKS = 102
+
+
+def run_tasks(seq, func, kwargs=None, chunksize=1, callback=None, root=0,
+              comm=None, sleep=0.001):
+    """
+    Run func on every item of seq with a master/worker scheduler: rank root
+    hands out chunks of chunksize items to the other ranks as they ask for
+    more work, so that the load balances itself when item costs vary.
+    Must be called by all ranks, with the same seq. With a single rank, runs
+    everything on it.
+
+    Args:
+      seq, func, kwargs: see skutil.collect(). The outputs of func can be any
+        picklable objects.
+
+      chunksize (int): [optional] items handed out per request.
+
+      callback (function): [optional] called on root as callback(i, output)
+        for each output, as soon as it arrives (not in order).
+
+      root (int): [optional] rank of the master.
+
+      comm (MPI.Comm): [optional] defaults to MPI.COMM_WORLD.
+
+      sleep (float): [optional] seconds between polls of the master for
+        requests, so that it does not occupy a CPU while waiting.
+
+    Returns:
+      On root, (outputs, stats): outputs is the list of outputs in the order
+      of seq, and stats is a Table with a row per rank and columns
+      ['items', 'busy', 'wall', 'utilization'], where busy is the time spent
+      in func (and in callback, for root), in seconds.
+      On other ranks, (None, None).
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    # Messages of this call must not be mixed up with those of the next one:
+    # ranks can leave the final gather, and send their next request, before
+    # root has received all requests of this call.
+    comm = comm.Dup()
+    seq = list(seq)
+    t_start = time.time()
+    rank = comm.Get_rank()
+    busy = 0.
+    num_items = 0
+
+    if comm.Get_size() == 1:
+        outputs = []
+        for i, item in enumerate(seq):
+            t = time.time()
+            outputs.append(skutil._call_with_kwargs(func, kwargs, item))
+            if callback:
+                callback(i, outputs[-1])
+            busy += time.time() - t
+        num_items = len(seq)
+    elif rank == root:
+        outputs = [None] * len(seq)
+        next_pos = 0
+        num_workers = comm.Get_size() - 1
+        status = MPI.Status()
+        while num_workers > 0:
+            while not comm.Iprobe(MPI.ANY_SOURCE, _TAG_REQUEST, status):
+                time.sleep(sleep)
+            worker = status.Get_source()
+            done = comm.recv(None, worker, _TAG_REQUEST)
+            t = time.time()
+            for i, output in done:
+                outputs[i] = output
+                if callback:
+                    callback(i, output)
+            busy += time.time() - t
+            if next_pos < len(seq):
+                end = min(next_pos + chunksize, len(seq))
+                comm.send(range(next_pos, end), worker, _TAG_TASKS)
+                next_pos = end
+            else:
+                comm.send(None, worker, _TAG_TASKS)
+                num_workers -= 1
+    else:
+        outputs = None
+        done = []
+        while True:
+            comm.send(done, root, _TAG_REQUEST)
+            positions = comm.recv(None, root, _TAG_TASKS)
+            if positions is None:
+                break
+            t = time.time()
+            done = [(i, skutil._call_with_kwargs(func, kwargs, seq[i]))
+                    for i in positions]
+            busy += time.time() - t
+            num_items += len(positions)
+
+    wall = time.time() - t_start
+    stats = comm.gather((num_items, busy, wall), root)
+    comm.Free()
+    if rank != root:
+        return (None, None)
+    stats = np.array(stats, dtype=float)
+    stats = np.hstack((stats, stats[:, 1:2] / np.maximum(stats[:, 2:3], 1e-12)))
+    stats = Table(stats, ['items', 'busy', 'wall', 'utilization'],
+                  ['rank %d' % r for r in range(len(stats))], 'run_tasks')
+    return (outputs, stats)
+
+
+def gather_tictoc(tictoc, root=0, comm=None):
+    """
+    Gather the label statistics of a TicToc from all ranks to root, with a
+    single gather of per-label (calls, total) pairs, and compare the time
+    each rank spent in each label. Call it once, at the end of a run.
+
+    Returns:
+      On root, a Table with a row per label path (named like 'a/b/label'),
+      and columns
+        ['ranks', 'calls', 'min', 'median', 'max', 'mean', 'imbalance',
+         'max_rank'],
+      where min/median/max/mean are over the ranks' total seconds in the
+      label (0 for ranks that never recorded it), imbalance is max / mean
+      (1 when balanced) and max_rank is the slowest rank.
+      On other ranks, None.
+    """
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    local = dict(('/'.join(path), (s.calls, s.estimated_total))
+                 for path, s in tictoc.stats.iteritems())
+    all_stats = comm.gather(local, root)
+    if comm.Get_rank() != root:
+        return None
+    names = sorted(set(name for stats in all_stats for name in stats))
+    rows = []
+    for name in names:
+        calls = sum(stats[name][0] for stats in all_stats if name in stats)
+        totals = np.array([stats[name][1] if name in stats else 0.
+                           for stats in all_stats])
+        mean = totals.mean()
+        rows.append([sum(name in stats for stats in all_stats), calls,
+                     totals.min(), np.median(totals), totals.max(), mean,
+                     totals.max() / mean if mean > 0 else 1.,
+                     totals.argmax()])
+    arr = np.array(rows) if rows else np.zeros((0, 8))
+    return Table(arr, ['ranks', 'calls', 'min', 'median', 'max', 'mean',
+                       'imbalance', 'max_rank'],
+                 names, 'TicToc summary across ranks')
+
+
+def report_tictoc(tictoc, root=0, comm=None):
+    """
+    Print gather_tictoc() on root, as one table for all ranks, with labels
+    indented by nesting depth.
+
+    Returns:
+      On root, the Table from gather_tictoc(); on other ranks, None.
+    """
+    summary = gather_tictoc(tictoc, root, comm)
+    if summary is None:
+        return None
+    print "%-32s %6s %9s %10s %10s %10s %9s %8s" % (
+        'label', 'ranks', 'calls', 'min', 'median', 'max', 'imbalance',
+        'max_rank')
+    for name, row in zip(summary.index or [], summary.arr):
+        parts = name.split('/')
+        label = '  ' * (len(parts) - 1) + parts[-1]
+        print "%-32s %6d %9d %10.4f %10.4f %10.4f %9.2f %8d" % (
+            label, row[0], row[1], row[2], row[3], row[4], row[6], row[7])
+    return summary
@@ -1,5 +1,8 @@
+import os
+import json
 import warnings
 import operator
+import itertools
 import types
 import numpy as np
 
@@ -58,7 +61,66 @@ class Table:
         """
         Return index of the given column name.
         """
-        return self.cols.index(col_name)
+        return self.name_inds([col_name])[0]
+
+    def name_inds(self, names, axis=1):
+        """
+        Return list of positions of the given names in
+        - cols, if axis==1;
+        - or index, if axis==0.
+
+        Behaves like calling list.index() for each name, raising ValueError
+        for a missing name, but takes O(1) per name: name->position dicts
+        are built on first lookup and rebuilt only when the list has been
+        replaced or modified.
+        """
+        attr = 'cols' if axis == 1 else 'index'
+        names_list = getattr(self, attr)
+        if not hasattr(self, '_name_maps'):
+            self._name_maps = {}
+        cached = self._name_maps.get(attr)
+        if cached is None or cached[0] is not names_list or \
+                cached[1] != len(names_list):
+            cached = self._build_name_map(attr)
+        inds = []
+        for name in names:
+            ind = cached[2].get(name)
+            if ind is None or names_list[ind] != name:
+                # the list may have been modified in place since the build
+                cached = self._build_name_map(attr)
+                ind = cached[2].get(name)
+                if ind is None:
+                    raise ValueError("%r is not in %s" % (name, attr))
+            inds.append(ind)
+        return inds
+
+    def _build_name_map(self, attr):
+        """
+        Build and cache the name->position dict for self.<attr>.
+        For duplicate names, the first position is kept, as in list.index().
+        """
+        names_list = getattr(self, attr)
+        name_map = {}
+        for i in xrange(len(names_list) - 1, -1, -1):
+            name_map[names_list[i]] = i
+        self._name_maps[attr] = (names_list, len(names_list), name_map)
+        return self._name_maps[attr]
+
+    def _share_name_map(self, table, attr):
+        """
+        Give table the cached name->position dict of self.<attr>, if there
+        is one and table.<attr> holds the same number of names.
+        The dicts are never modified after being built, so this is safe:
+        name_inds() verifies every lookup against the list anyway.
+        """
+        cached = getattr(self, '_name_maps', {}).get(attr)
+        names_list = getattr(table, attr)
+        if cached is None or names_list is None or \
+                cached[1] != len(names_list):
+            return
+        if not hasattr(table, '_name_maps'):
+            table._name_maps = {}
+        table._name_maps[attr] = (names_list, len(names_list), cached[2])
 
     def __copy__(self):
         """
@@ -68,7 +130,10 @@ class Table:
         cols = list(self.cols) if not self.cols is None else None
         index = list(self.index) if hasattr(
             self, 'index') and not self.index is None else None
-        return Table(arr, cols, index, self.name)
+        table = Table(arr, cols, index, self.name)
+        self._share_name_map(table, 'cols')
+        self._share_name_map(table, 'index')
+        return table
 
     def copy(self):
         return self.__copy__()
@@ -104,25 +169,157 @@ class Table:
         """
         with open(filename, 'w') as f:
             f.write("%s\n" % ','.join(self.cols))
-            if hasattr(self, 'index'):
+            if getattr(self, 'index', None):
                 f.write("%s\n" % ','.join(self.index))
             f.write("%s\n" % self.name)
             np.savetxt(f, self.arr, delimiter=',')
 
     @classmethod
-    def load_from_csv(cls, filename):
+    def load_from_csv(cls, filename, chunk_size=100000):
         """
         Creates a new Table object by reading in a csv file with header.
+
+        The number of rows is counted first, so the data is parsed in chunks
+        of chunk_size rows directly into a preallocated float array.
         """
+        num_lines = Table._count_lines(filename)
         table = Table()
         with open(filename) as f:
             table.cols = f.readline().strip().split(',')
             table.name = f.readline().strip()
-        table.arr = np.loadtxt(filename, delimiter=',', skiprows=2)
-        assert(len(table.cols) == table.arr.shape[1])
+            arr = np.empty((max(num_lines - 2, 0), len(table.cols)))
+            num_rows = 0
+            for chunk in Table._read_csv_chunks(f, len(table.cols), chunk_size):
+                arr[num_rows:num_rows + chunk.shape[0]] = chunk
+                num_rows += chunk.shape[0]
+        # blank lines are skipped, so there may be fewer rows than lines
+        table.arr = arr[:num_rows]
+        return table
+
+    @classmethod
+    def load_from_csv_in_chunks(cls, filename, chunk_size=100000):
+        """
+        Generator of Tables of up to chunk_size rows each, read in order from
+        a csv file with header (as in load_from_csv()).
+        Only one chunk is held in memory at a time, so it can be used to
+        filter or aggregate files that are larger than memory.
+        """
+        with open(filename) as f:
+            cols = f.readline().strip().split(',')
+            name = f.readline().strip()
+            for chunk in Table._read_csv_chunks(f, len(cols), chunk_size):
+                yield Table(chunk, list(cols), None, name)
+
+    @staticmethod
+    def _count_lines(filename):
+        """
+        Return number of lines in the file, reading it in large blocks.
+        """
+        num_lines = 0
+        last_block = ''
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), ''):
+                num_lines += block.count('\n')
+                last_block = block
+        if last_block and not last_block.endswith('\n'):
+            num_lines += 1
+        return num_lines
+
+    @staticmethod
+    def _read_csv_chunks(f, num_cols, chunk_size):
+        """
+        Generator of (chunk_size, num_cols) float arrays parsed from the
+        remaining lines of open file f. The last chunk may be shorter.
+        Blank lines are skipped.
+        """
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if len(lines) == 0:
+                return
+            lines = [line for line in lines if line.strip()]
+            if len(lines) == 0:
+                continue
+            for line in lines:
+                if line.count(',') != num_cols - 1:
+                    raise ValueError(
+                        "Wrong number of columns, expected %d: %r" % (
+                            num_cols, line.rstrip()))
+            # unlike np.fromstring(), float() rejects empty fields and
+            # trailing garbage
+            yield np.array([line.split(',') for line in lines], dtype=float)
+
+    def save_npy(self, filename):
+        """
+        Write array to file in binary .npy format, and the cols, index and
+        name to a json file alongside it (filename + '.json').
+        Unlike save_csv(), this round-trips the array exactly.
+        """
+        arr_filename, meta_filename = Table._npy_filenames(filename)
+        np.save(arr_filename, self.arr)
+        meta = {'cols': self.cols, 'name': self.name,
+                'index': self.index if hasattr(self, 'index') else None}
+        with open(meta_filename, 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load_from_npy(cls, filename, mmap_mode='c'):
+        """
+        Creates a new Table object from files written by save_npy().
+
+        Args:
+          filename (string): path given to save_npy().
+
+          mmap_mode (string): [optional] passed to np.load(). By default,
+            the array is memory-mapped copy-on-write, so the Table is usable
+            immediately, only the rows that are accessed are read from disk,
+            and modifications never touch the file.
+            If None, the whole array is read into memory.
+
+        Returns:
+          table (Table)
+        """
+        arr_filename, meta_filename = Table._npy_filenames(filename)
+        with open(meta_filename) as f:
+            meta = json.load(f)
+        # np.memmap cannot map a zero-length payload
+        if mmap_mode and os.path.getsize(arr_filename) > 0:
+            arr = np.load(arr_filename, mmap_mode=mmap_mode)
+            if arr.size == 0:
+                arr = np.array(arr)
+        else:
+            arr = np.load(arr_filename)
+        cols = Table._from_json_strings(meta['cols'])
+        index = Table._from_json_strings(meta['index'])
+        name = Table._from_json_strings(meta['name'])
+        table = Table(arr, cols, index, name)
+        if cols is not None:
+            assert(table.arr.size == 0 or len(cols) == table.arr.shape[1])
         return table
 
-    def subset(self, names_or_inds_or_mask, axis=1):
+    @staticmethod
+    def _npy_filenames(filename):
+        """
+        Return the array and metadata filenames used by save_npy().
+        """
+        if filename.endswith('.npy'):
+            filename = filename[:-len('.npy')]
+        return (filename + '.npy', filename + '.json')
+
+    @staticmethod
+    def _from_json_strings(x):
+        """
+        json returns unicode strings; convert back to str where possible.
+        """
+        if isinstance(x, list):
+            return [Table._from_json_strings(y) for y in x]
+        if isinstance(x, unicode):
+            try:
+                return str(x)
+            except UnicodeEncodeError:
+                return x
+        return x
+
+    def subset(self, names_or_inds_or_mask, axis=1, view=False):
         """
         Return copy of Table with only the specified
         - columns, if axis==1;
@@ -135,10 +332,19 @@ class Table:
 
         In the former two cases, the copy will return Table with the
         columns or rows in given order.
+
+        If view, and the selection is an evenly spaced increasing run of
+        columns or rows (e.g. a contiguous range, or a mask with a single run
+        of True values), the array of the returned Table is a read-only view
+        of this Table's array instead of a copy. Call copy() on the returned
+        Table before modifying its array.
         """
         arr, cols, index = self.subset_arr_and_cols_and_index(
-            names_or_inds_or_mask, axis)
-        return Table(arr, cols, index, self.name)
+            names_or_inds_or_mask, axis, view)
+        table = Table(arr, cols, index, self.name)
+        if axis == 1:
+            self._share_name_map(table, 'index')
+        return table
 
     def subset_arr(self, names_or_inds_or_mask, axis=1):
         """
@@ -157,7 +363,8 @@ class Table:
         else:
             return arr.squeeze()
 
-    def subset_arr_and_cols_and_index(self, names_or_inds_or_mask, axis):
+    def subset_arr_and_cols_and_index(self, names_or_inds_or_mask, axis,
+                                      view=False):
         """
         Helper method to subset() and subset_arr().
         """
@@ -167,8 +374,11 @@ class Table:
                 not isinstance(names_or_inds_or_mask, types.ListType):
             names_or_inds_or_mask = [names_or_inds_or_mask]
 
+        if isinstance(names_or_inds_or_mask, np.ndarray) and \
+                names_or_inds_or_mask.dtype.kind in 'biu':
+            inds = names_or_inds_or_mask
         # bool is a subclass of int, so this check gets both ints and booleans
-        if isinstance(names_or_inds_or_mask[0], types.IntType):
+        elif isinstance(names_or_inds_or_mask[0], types.IntType):
             inds = names_or_inds_or_mask
         # we also support floats, for backwards compatibility reasons
         elif isinstance(names_or_inds_or_mask[0], types.FloatType):
@@ -176,33 +386,74 @@ class Table:
         elif isinstance(names_or_inds_or_mask[0], types.StringType):
             if axis == 0:
                 assert(self.index)
-                inds = [self.index.index(name)
-                        for name in names_or_inds_or_mask]
-            else:
-                inds = [self.cols.index(name)
-                        for name in names_or_inds_or_mask]
+            inds = self.name_inds(names_or_inds_or_mask, axis)
         else:
             raise RuntimeError(
                 'names_or_inds_or_mask must be a list of one of those three!')
 
+        if view:
+            slc = Table._inds_to_slice(inds, self.arr.shape[axis])
+            if slc is not None:
+                inds = slc
         if axis == 0:
             cols = self.cols
             if hasattr(self, 'index'):
-                index = np.array(
-                    self.index)[inds].tolist() if self.index else None
+                index = Table._subset_list(
+                    self.index, inds) if self.index else None
             arr = self.arr[inds, :]
         else:
-            cols = np.array(self.cols)[inds].tolist()
+            cols = Table._subset_list(self.cols, inds)
             if hasattr(self, 'index'):
                 index = self.index
             arr = self.arr[:, inds]
+        if isinstance(inds, slice):
+            arr.flags.writeable = False
         return (arr, cols, index)
 
-    def row_subset(self, names_or_inds_or_mask):
+    @staticmethod
+    def _inds_to_slice(inds, n):
+        """
+        Return slice selecting the same elements out of n as the given
+        indices or Boolean mask, or None if there is no such slice.
+        """
+        inds = np.asarray(inds)
+        if inds.ndim != 1 or inds.size == 0:
+            return None
+        if inds.dtype == bool:
+            if inds.shape[0] != n:
+                return None
+            inds = np.flatnonzero(inds)
+            if inds.size == 0:
+                return None
+        inds = np.where(inds < 0, inds + n, inds)
+        # out of range indices are left to fail as they do without a view
+        if inds.min() < 0 or inds.max() >= n:
+            return None
+        if inds.size == 1:
+            return slice(inds[0], inds[0] + 1)
+        step = inds[1] - inds[0]
+        if step <= 0 or np.any(np.diff(inds) != step):
+            return None
+        return slice(inds[0], inds[-1] + 1, step)
+
+    @staticmethod
+    def _subset_list(names, inds):
+        """
+        Return list of the elements of names selected by the given slice,
+        indices or Boolean mask, without converting names to an ndarray.
+        """
+        if isinstance(inds, slice):
+            return names[inds]
+        inds = np.asarray(inds)
+        if inds.dtype == bool:
+            return list(itertools.compress(names, inds))
+        return [names[i] for i in inds]
+
+    def row_subset(self, names_or_inds_or_mask, view=False):
         """
         Return Table with only the specified rows. See subset().
         """
-        return self.subset(names_or_inds_or_mask, axis=0)
+        return self.subset(names_or_inds_or_mask, axis=0, view=view)
 
     def row_subset_arr(self, names_or_inds_or_mask):
         """
@@ -214,50 +465,231 @@ class Table:
         """
         Return copy of self with array sorted by column.
         """
-        col = self.arr[:, self.cols.index(col_name)]
+        col = self.arr[:, self.ind(col_name)]
         col = -col if descending else col
         inds = col.argsort()
         self.arr = self.arr[inds]
         if hasattr(self, 'index'):
-            self.index = np.array(
-                self.index)[inds].tolist() if self.index else None
+            self.index = Table._subset_list(
+                self.index, inds) if self.index else None
         return self
 
-    def filter_on_column(self, col_name, val=True, op=operator.eq, omit=False):
+    def filter_on_column(self, col_name, val=True, op=operator.eq, omit=False,
+                         view=False):
         """
         Take name of column and value to filter by, and return
         copy of self with only the rows that satisfy the filter.
         Default value is True.
         By providing an operator, more than just equality filtering can be done.
         If omit, removes that column from the returned copy.
+        If view, the returned array may be a read-only view (see subset()).
         """
         if col_name not in self.cols:
             warnings.warn("Column name not found in the Table.")
             return self
         if self.shape[0] < 1:
             return self
-        table = self.copy()
-        col_ind = table.cols.index(col_name)
-        mask = op(table.arr[:, col_ind], val)
-        table.arr = table.arr[mask, :]
-        table.index = np.array(
-            table.index)[mask].tolist() if table.index else None
+        mask = op(self.arr[:, self.ind(col_name)], val)
+        arr, cols, index = self.subset_arr_and_cols_and_index(mask, 0, view)
+        table = Table(arr, list(cols), index, self.name)
         if omit:
-            return table.with_column_omitted(col_name)
+            return table.with_column_omitted(col_name, view)
         return table
 
-    def with_column_omitted(self, col_name):
+    def query(self, predicate, view=False):
+        """
+        Return copy of self with only the rows that satisfy the predicate,
+        which combines conditions on any number of columns (see Column).
+        The whole predicate is evaluated into a single Boolean mask, and the
+        rows are selected once, rather than copying the table for each
+        condition as chained filter_on_column() calls do.
+        If view, the returned array may be a read-only view (see subset()).
+        """
+        if self.shape[0] < 1:
+            return self
+        mask = predicate.mask(self)
+        arr, cols, index = self.subset_arr_and_cols_and_index(mask, 0, view)
+        return Table(arr, list(cols), index, self.name)
+
+    def groupby(self, col_name, aggs='mean'):
+        """
+        Group rows by the value of the given column, and aggregate each of the
+        other columns within each group.
+
+        Args:
+          col_name (string): name of the key column.
+
+          aggs (string or list): one or more of 'sum', 'mean', 'count', 'min',
+            'max', 'argmax'. 'argmax' gives the row number in self of the
+            maximum value in the group (first one, if tied).
+
+        Returns:
+          Table with one row per distinct key, in sorted order, the keys in
+          its first column, named col_name, and no index. With a single
+          aggregation other than 'count', the other columns have the same
+          names as in self; otherwise they are named <col>_<agg>. 'count'
+          adds a single column named 'count'.
+
+        Raises:
+          ValueError if an aggregation is not known.
+        """
+        if isinstance(aggs, basestring):
+            aggs = [aggs]
+        for agg in aggs:
+            if agg not in ['sum', 'mean', 'count', 'min', 'max', 'argmax']:
+                raise ValueError("Unknown aggregation: %s" % agg)
+        key_ind = self.ind(col_name)
+        val_inds = [i for i in xrange(len(self.cols)) if i != key_ind]
+        val_cols = [self.cols[i] for i in val_inds]
+
+        num_rows = self.shape[0] if self.arr.size > 0 else 0
+        if num_rows > 0:
+            # sort by key once; stable, so tied rows stay in original order
+            order = np.argsort(self.arr[:, key_ind], kind='mergesort')
+            keys = self.arr[order, key_ind]
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            group_keys = keys[starts]
+            counts = np.diff(np.r_[starts, num_rows])
+            vals = self.arr[order][:, val_inds]
+        else:
+            starts = np.zeros(0, dtype=int)
+            group_keys = np.zeros(0)
+            counts = np.zeros(0, dtype=int)
+            vals = np.zeros((0, len(val_inds)))
+
+        results = [group_keys[:, np.newaxis]]
+        cols = [col_name]
+        for agg in aggs:
+            if agg == 'count':
+                results.append(counts[:, np.newaxis])
+                cols.append('count')
+                continue
+            if len(starts) == 0:
+                result = vals
+            elif agg in ('sum', 'mean'):
+                result = np.add.reduceat(vals, starts, axis=0)
+                if agg == 'mean':
+                    result = result / counts[:, np.newaxis].astype(float)
+            elif agg == 'min':
+                result = np.minimum.reduceat(vals, starts, axis=0)
+            elif agg == 'max':
+                result = np.maximum.reduceat(vals, starts, axis=0)
+            elif agg == 'argmax':
+                group_ids = np.repeat(np.arange(len(starts)), counts)
+                result = np.empty((len(starts), len(val_inds)), dtype=int)
+                for j in xrange(len(val_inds)):
+                    # within each group, the largest value sorts first
+                    within = np.lexsort((-vals[:, j], group_ids))
+                    result[:, j] = order[within[starts]]
+            results.append(result)
+            if len(aggs) == 1:
+                cols += val_cols
+            else:
+                cols += ['%s_%s' % (col, agg) for col in val_cols]
+        return Table(np.hstack(results), cols, None, self.name)
+
+    def join(self, other, on, how='inner', suffixes=('_left', '_right')):
+        """
+        Join rows of self with rows of other Table that have equal values in
+        the key column(s).
+
+        Args:
+          other (Table): Table to join with.
+
+          on (string or list): name(s) of the key column(s), present in both.
+
+          how (string): [optional]
+            - 'inner': only rows of self that have a match in other.
+            - 'left': all rows of self; the columns of other are NaN for the
+              rows without a match.
+
+          suffixes (tuple): [optional] appended to names of non-key columns
+            that are present in both Tables.
+
+        Returns:
+          Table with the columns of self followed by the non-key columns of
+          other. Rows are in the order of self, and a row of self that
+          matches several rows of other is repeated for each, in the order
+          of other. The index is the index of self, repeated accordingly.
+
+        Raises:
+          ValueError if how is not 'inner' or 'left'.
+        """
+        if how not in ('inner', 'left'):
+            raise ValueError("how must be 'inner' or 'left'")
+        if isinstance(on, basestring):
+            on = [on]
+        left_keys = self.arr[:, self.name_inds(on)] if self.arr.size > 0 \
+            else np.zeros((0, len(on)))
+        right_keys = other.arr[:, other.name_inds(on)] if other.arr.size > 0 \
+            else np.zeros((0, len(on)))
+        num_left = left_keys.shape[0]
+
+        # reduce the key column(s) to one sortable key per row
+        if len(on) == 1:
+            left_ids = left_keys[:, 0]
+            right_ids = right_keys[:, 0]
+        else:
+            ids = np.unique(np.vstack((left_keys, right_keys)), axis=0,
+                            return_inverse=True)[1]
+            left_ids = ids[:num_left]
+            right_ids = ids[num_left:]
+
+        # sort-merge: for every left row, find its run of equal right keys
+        right_order = np.argsort(right_ids, kind='mergesort')
+        sorted_right_ids = right_ids[right_order]
+        starts = np.searchsorted(sorted_right_ids, left_ids, 'left')
+        counts = np.searchsorted(sorted_right_ids, left_ids, 'right') - starts
+        missing = counts == 0
+        if how == 'left':
+            counts[missing] = 1
+        left_rows = np.repeat(np.arange(num_left), counts)
+        offsets = np.arange(left_rows.shape[0]) - \
+            np.repeat(np.cumsum(counts) - counts, counts)
+        right_pos = np.repeat(starts, counts) + offsets
+        if how == 'left':
+            right_pos[np.repeat(missing, counts)] = -1
+
+        right_inds = [i for i, col in enumerate(other.cols) if col not in on]
+        num_left_cols = self.shape[1] if self.arr.size > 0 else len(self.cols)
+        right_vals = other.arr[:, right_inds] if other.arr.size > 0 else \
+            np.zeros((0, len(right_inds)))
+        dtype = np.result_type(self.arr, right_vals)
+        if how == 'left' and np.any(missing):
+            dtype = np.result_type(dtype, np.nan)
+        arr = np.empty((left_rows.shape[0], num_left_cols + len(right_inds)),
+                       dtype=dtype)
+        if self.arr.size > 0:
+            arr[:, :num_left_cols] = self.arr[left_rows]
+        found = right_pos >= 0
+        arr[found, num_left_cols:] = right_vals[right_order[right_pos[found]]]
+        arr[~found, num_left_cols:] = np.nan
+
+        right_cols = [other.cols[i] for i in right_inds]
+        left_cols = [col + suffixes[0] if col in right_cols else col
+                     for col in self.cols]
+        right_cols = [col + suffixes[1] if col in self.cols else col
+                      for col in right_cols]
+        index = Table._subset_list(self.index, left_rows) if \
+            self.index else None
+        return Table(arr, left_cols + right_cols, index, self.name)
+
+    def with_column_omitted(self, col_name, view=False):
         """
         Return Table with given column omitted. Not necessarily a copy.
+        If view, and the column is the first or last one, the returned array
+        is a read-only view (see subset()).
         """
-        drop_mask = np.arange(self.shape[1]) == self.cols.index(col_name)
+        drop_mask = np.arange(self.shape[1]) == self.ind(col_name)
         if self.arr.size > 0:
-            arr = self.arr[:, -drop_mask]
+            arr = self.subset_arr_and_cols_and_index(~drop_mask, 1, view)[0]
         else:
             arr = self.arr
         cols = list(self.cols)
         cols.remove(col_name)
-        return Table(arr, cols, self.index, self.name)
+        table = Table(arr, cols, self.index, self.name)
+        self._share_name_map(table, 'index')
+        return table
 
     def append_column(self, col_name, vals):
         """
@@ -266,7 +698,119 @@ class Table:
         if isinstance(vals, list):
             vals = np.array(vals)
         assert(vals.ndim == 1 and vals.shape[0] == self.shape[0])
-        table = self.copy()
-        table.cols = self.cols + [col_name]
-        table.arr = np.hstack((self.arr, np.atleast_2d(vals).T))
+        arr = np.empty((self.shape[0], self.shape[1] + 1),
+                       dtype=np.result_type(self.arr, vals))
+        arr[:, :-1] = self.arr
+        arr[:, -1] = vals
+        index = list(self.index) if self.index is not None else None
+        table = Table(arr, self.cols + [col_name], index, self.name)
+        self._share_name_map(table, 'index')
         return table
+
+
+class Column:
+    """
+    Reference to a Table column by name, for building Predicates:
+    comparing a Column to a value gives a Predicate that selects the rows
+    where the comparison holds.
+
+    >>> p = (Column('score') > 0.5) & Column('cls').isin([1, 2])
+    >>> p = p | ~Column('x').between(0, 10)
+    >>> table.query(p)
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def _compare(self, op, val):
+        return Predicate('leaf', self.name, lambda col: op(col, val))
+
+    def __eq__(self, val):
+        return self._compare(operator.eq, val)
+
+    def __ne__(self, val):
+        return self._compare(operator.ne, val)
+
+    def __lt__(self, val):
+        return self._compare(operator.lt, val)
+
+    def __le__(self, val):
+        return self._compare(operator.le, val)
+
+    def __gt__(self, val):
+        return self._compare(operator.gt, val)
+
+    def __ge__(self, val):
+        return self._compare(operator.ge, val)
+
+    def between(self, low, high, inclusive=True):
+        """
+        Predicate for low <= value <= high (or strict, if not inclusive).
+        """
+        low_op, high_op = (operator.ge, operator.le) if inclusive else \
+            (operator.gt, operator.lt)
+
+        def func(col):
+            mask = low_op(col, low)
+            return np.logical_and(mask, high_op(col, high), out=mask)
+        return Predicate('leaf', self.name, func)
+
+    def isin(self, vals):
+        """
+        Predicate for value being one of vals.
+        """
+        vals = np.asarray(list(vals))
+        return Predicate('leaf', self.name, lambda col: np.in1d(col, vals))
+
+
+class Predicate:
+    """
+    Boolean condition on the rows of a Table, made by comparing Columns
+    and combined with & (and), | (or) and ~ (not). See Table.query().
+    """
+
+    def __init__(self, kind, col_name=None, func=None, children=None):
+        self.kind = kind
+        self.col_name = col_name
+        self.func = func
+        self.children = children
+
+    def __nonzero__(self):
+        # 'and', 'or', 'not' and chained comparisons would silently drop terms
+        raise TypeError("use &, |, ~ to combine predicates")
+
+    def __and__(self, other):
+        return Predicate('and', children=[self, other])
+
+    def __or__(self, other):
+        return Predicate('or', children=[self, other])
+
+    def __invert__(self):
+        return Predicate('not', children=[self])
+
+    def _terms(self, kind):
+        """
+        Flatten nested predicates of the given kind into a list of terms.
+        """
+        if self.kind != kind:
+            return [self]
+        return [t for child in self.children for t in child._terms(kind)]
+
+    def mask(self, table):
+        """
+        Return Boolean mask over the rows of table.
+        All terms are combined in place into the first term's mask, so only
+        one mask is alive per level of nesting.
+        """
+        if self.kind == 'leaf':
+            col = table.arr[:, table.ind(self.col_name)]
+            return np.asarray(self.func(col), dtype=bool)
+        if self.kind == 'not':
+            mask = self.children[0].mask(table)
+            return np.logical_not(mask, out=mask)
+        combine = np.logical_and if self.kind == 'and' else np.logical_or
+        terms = self._terms(self.kind)
+        mask = terms[0].mask(table)
+        for term in terms[1:]:
+            combine(mask, term.mask(table), out=mask)
+        return mask
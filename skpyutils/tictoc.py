@@ -1,18 +1,219 @@
+import os
+import sys
+import json
 import time
+import random
+import thread
+import threading
+import collections
+import weakref
+import functools
+import numpy as np
+
+
+def _monotonic_clock():
+    """
+    Return function giving seconds from a monotonic, high-resolution clock:
+    time.perf_counter() where there is one, CLOCK_MONOTONIC through ctypes
+    on Linux, and time.time() otherwise.
+    """
+    if hasattr(time, 'perf_counter'):
+        return time.perf_counter
+    if not sys.platform.startswith('linux'):
+        return time.time
+    try:
+        import ctypes
+        import ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+        lib = ctypes.util.find_library('rt') or ctypes.util.find_library('c')
+        clock_gettime = ctypes.CDLL(lib).clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        ts = timespec()
+        ts_ref = ctypes.byref(ts)
+        CLOCK_MONOTONIC = 1
+
+        def monotonic():
+            clock_gettime(CLOCK_MONOTONIC, ts_ref)
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+        monotonic()
+        return monotonic
+    except (OSError, AttributeError, TypeError):
+        return time.time
+
+clock = _monotonic_clock()
+# for Progress, which reads the time on every update
+_progress_clock = getattr(time, 'perf_counter', time.time)
+
+
+class LabelStats:
+    """
+    Running statistics of the durations recorded for one label: count,
+    total, min and max, and a uniform random sample of up to max_samples
+    durations for percentiles.
+    Calls that were not timed because of sampling are counted in skipped.
+    """
+
+    def __init__(self, max_samples=1000):
+        self.count = 0
+        self.skipped = 0
+        self.total = 0.
+        self.min = float('inf')
+        self.max = 0.
+        self.samples = []
+        self.max_samples = max_samples
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+        if len(self.samples) < self.max_samples:
+            self.samples.append(duration)
+        else:
+            # reservoir sampling keeps every duration equally likely
+            i = random.randint(0, self.count - 1)
+            if i < self.max_samples:
+                self.samples[i] = duration
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.
+
+    @property
+    def calls(self):
+        return self.count + self.skipped
+
+    @property
+    def estimated_total(self):
+        """
+        Total extrapolated from the timed calls to all calls.
+        """
+        return self.mean * self.calls
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.
+        return np.percentile(self.samples, q)
 
 
 class TicToc:
     """
-    MATLAB-like tic/toc.
+    MATLAB-like tic/toc, that also keeps statistics of all recorded timings.
+
+    Every toc() records the elapsed time for its label. Timings can also be
+    recorded with the scope() context manager and the timed() decorator,
+    which nest: a label timed inside scope 'a' is recorded as 'a/label'.
+    summary() and report() give per-label counts, totals, means, min, max
+    and percentiles.
+
+    For instrumentation left in hot loops, set_sampling(n) times only one in
+    n calls per label and extrapolates totals, and set_enabled(False) (or
+    TicToc.set_enabled_globally(False) for all instances) replaces the
+    timing methods with no-ops.
+
+    Each recorded timing is also kept as a span (label path, start, end,
+    thread id) in a ring buffer of the last max_spans timings, which
+    export_jsonl() and export_chrome_trace() write out for later analysis.
+
+    >>> tt = TicToc()
+    >>> with tt.scope('detect'):
+    ...     with tt.scope('nms'):
+    ...         pass
+    >>> tt.report()
     """
 
-    def __init__(self):
+    _instances = weakref.WeakSet()
+    _enabled_globally = True
+
+    def __init__(self, max_spans=100000):
         """
         Start the timer on init.
+
+        Args:
+          max_spans (int): [optional] number of most recent spans to keep
+            for export
         """
         self.labels = {}
+        self.stats = {}
+        self.spans = collections.deque(maxlen=max_spans)
+        self.num_spans = 0
+        # offset from clock() to seconds since the epoch, for export
+        self._epoch = time.time() - clock()
+        self.sample_every = 1
+        # open scopes and tic() paths are per thread
+        self._local = _ThreadState()
+        self._progress = {}
+        self._calls = {}
+        self._skipped = set()
+        TicToc._instances.add(self)
+        if not TicToc._enabled_globally:
+            self.set_enabled(False)
         self.tic()
 
+    def set_enabled(self, enabled=True):
+        """
+        Enable or disable this instance. When disabled, tic(), toc(),
+        qtoc(), record(), scope() and running() are replaced by no-ops, so
+        each call costs about as much as calling an empty function, and
+        timed() returns functions undecorated.
+
+        Returns:
+          self
+        """
+        if enabled:
+            for name in ['tic', 'toc', 'qtoc', 'record', 'scope', 'timed',
+                         'running']:
+                self.__dict__.pop(name, None)
+            return self
+        self.tic = lambda label=None: self
+        self.toc = lambda label=None, quiet=False: 0.
+        self.qtoc = lambda label=None: 0.
+        self.record = lambda path, duration, start=None: None
+        self.scope = lambda label: _NULL_SCOPE
+        self.timed = lambda label=None: lambda func: func
+        self.running = lambda *args, **kwargs: self
+        return self
+
+    @classmethod
+    def set_enabled_globally(cls, enabled=True):
+        """
+        Enable or disable all existing and future instances.
+        """
+        cls._enabled_globally = enabled
+        for tictoc in list(cls._instances):
+            tictoc.set_enabled(enabled)
+
+    def set_sampling(self, every=1):
+        """
+        Time only one in every <every> calls for each label (the first,
+        then every <every>-th). The other calls are only counted, and toc()
+        returns the mean time of the sampled ones for them. Totals are
+        extrapolated in summary().
+
+        Returns:
+          self
+        """
+        self.sample_every = every
+        self._calls = {}
+        self._skipped = set()
+        return self
+
+    def _sample(self, label):
+        """
+        Return True if this call for label should be timed.
+        """
+        n = self._calls.get(label, 0)
+        self._calls[label] = n + 1
+        if n % self.sample_every == 0:
+            self._skipped.discard(label)
+            return True
+        self._skipped.add(label)
+        return False
+
     def tic(self, label=None):
         """
         Start timer for given label.
@@ -26,12 +227,22 @@ class TicToc:
         if not label:
             label = '_default'
         label = str(label)
-        self.labels[label] = time.time()
+        self._local.tic_paths[label] = tuple(self._local.scopes) + (label,)
+        if self.sample_every > 1 and not self._sample(label):
+            return self
+        self.labels[label] = clock()
         return self
 
+    def _tic_path(self, label):
+        """
+        Return the path recorded by tic() for label in this thread, or just
+        the label if it was started in another thread.
+        """
+        return self._local.tic_paths.get(label, (label,))
+
     def toc(self, label=None, quiet=False):
         """
-        Return elapsed time for given label.
+        Return elapsed time for given label, and record it in the statistics.
 
         Args:
           label (string): [optional] label for the timer.
@@ -39,13 +250,20 @@ class TicToc:
           quiet (boolean): [optional] print time elapsed if false
 
         Returns:
-          elapsed (float): time elapsed
+          elapsed (float): time elapsed, or if the call was not sampled
+            (see set_sampling()), the mean of the sampled calls
         """
         if not label:
             label = '_default'
         label = str(label)
+        if label in self._skipped:
+            stats = self._label_stats(self._tic_path(label))
+            stats.skipped += 1
+            return stats.mean
         assert(label in self.labels)
-        elapsed = time.time() - self.labels[label]
+        start = self.labels[label]
+        elapsed = clock() - start
+        self.record(self._tic_path(label), elapsed, start)
         name = " (%s)" % label if label else ""
         if not quiet:
             print "%s finished in %.3f s" % (name, elapsed)
@@ -57,16 +275,151 @@ class TicToc:
         """
         return self.toc(label, quiet=True)
 
-    def running(self, label=None, msg=None, interval=1):
+    def record(self, path, duration, start=None):
+        """
+        Add duration to the statistics of the label path (a tuple of scope
+        names ending with the label), and add a span for it, started at
+        start (a clock() time; by default, duration ago).
+        """
+        self._label_stats(path).add(duration)
+        if start is None:
+            start = clock() - duration
+        self.spans.append((path, start, duration, thread.get_ident()))
+        self.num_spans += 1
+
+    def _label_stats(self, path):
+        if path not in self.stats:
+            self.stats[path] = LabelStats()
+        return self.stats[path]
+
+    def scope(self, label):
+        """
+        Return context manager that records the time spent in its block
+        under label, nested in the enclosing scopes.
+        """
+        return _Scope(self, str(label))
+
+    def timed(self, label=None):
+        """
+        Return decorator that records the time spent in each call of the
+        decorated function as a scope() named label (by default, the name of
+        the function).
+        """
+        def decorator(func):
+            name = label or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.scope(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        """
+        Return Table with a row per label path, in tree order, named like
+        'a/b/label', and columns
+        ['count', 'total', 'mean', 'min', 'max', 'p50', 'p90', 'p99',
+         'calls', 'est_total'],
+        with times in seconds. count and total are for the timed calls;
+        calls and est_total include the calls skipped by sampling.
+        """
+        from skpyutils.table import Table
+        paths = sorted(self.stats.keys())
+        rows = []
+        for path in paths:
+            s = self.stats[path]
+            rows.append([s.count, s.total, s.mean, s.min, s.max,
+                         s.percentile(50), s.percentile(90), s.percentile(99),
+                         s.calls, s.estimated_total])
+        arr = np.array(rows) if rows else np.zeros((0, 10))
+        return Table(arr, ['count', 'total', 'mean', 'min', 'max',
+                           'p50', 'p90', 'p99', 'calls', 'est_total'],
+                     ['/'.join(path) for path in paths], 'TicToc summary')
+
+    def report(self):
+        """
+        Print summary() as a table, with labels indented by nesting depth.
+        """
+        summary = self.summary()
+        print "%-32s %9s %10s %10s %10s %10s %10s" % (
+            'label', 'calls', 'total', 'mean', 'min', 'max', 'p90')
+        for name, row in zip(summary.index or [], summary.arr):
+            parts = name.split('/')
+            label = '  ' * (len(parts) - 1) + parts[-1]
+            print "%-32s %9d %10.4f %10.6f %10.6f %10.6f %10.6f" % (
+                label, row[8], row[9], row[2], row[3], row[4], row[6])
+
+    def _span_dicts(self):
+        """
+        Yield the buffered spans as dicts with keys 'name', 'path', 'start'
+        and 'end' (seconds since the epoch), 'duration', 'pid', 'tid' and
+        'rank' (the MPI rank if mpi4py.MPI is in use, else None).
         """
-        Print <msg> every <interval> seconds, running the timer for <label>.
+        pid = os.getpid()
+        rank = _mpi_rank()
+        for path, start, duration, tid in list(self.spans):
+            start += self._epoch
+            yield {'name': path[-1], 'path': '/'.join(path), 'start': start,
+                   'end': start + duration, 'duration': duration,
+                   'pid': pid, 'tid': tid, 'rank': rank}
+
+    def export_jsonl(self, filename):
+        """
+        Write the buffered spans to filename as JSON lines, one object per
+        span, oldest first (see _span_dicts() for the keys).
+
+        Returns:
+          number of spans written
+        """
+        n = 0
+        with open(filename, 'w') as f:
+            for span in self._span_dicts():
+                f.write(json.dumps(span) + '\n')
+                n += 1
+        return n
+
+    def export_chrome_trace(self, filename):
+        """
+        Write the buffered spans to filename in the Chrome trace-event
+        format, which chrome://tracing and Perfetto open. Spans are complete
+        ('X') events, grouped by MPI rank (or process id) and thread.
+
+        Returns:
+          number of spans written
+        """
+        events = []
+        for span in self._span_dicts():
+            pid = span['pid'] if span['rank'] is None else span['rank']
+            events.append({
+                'name': span['name'], 'cat': 'tictoc', 'ph': 'X',
+                'ts': span['start'] * 1e6, 'dur': span['duration'] * 1e6,
+                'pid': pid, 'tid': span['tid'],
+                'args': {'path': span['path']}})
+        dropped = self.num_spans - len(events)
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'dropped_spans': dropped}}, f)
+        return len(events)
+
+    def running(self, label=None, msg=None, interval=1, total=None,
+                count=1):
+        """
+        Count <count> items done for <label>, and print <msg> with the
+        progress (items done, rate and, given <total>, ETA) at most every
+        <interval> seconds. Call it once per item or batch of items; the
+        Progress for the label is created on the first call.
 
         Args:
           label (string): [optional] label for the timer
 
           msg (string): [optional] message to print
 
-          interval (int): [optional] print every <interval> seconds
+          interval (float): [optional] print every <interval> seconds
+
+          total (int): [optional] total number of items, for the ETA
+
+          count (int): [optional] number of items done since the last call
 
         Return
           self
@@ -74,8 +427,167 @@ class TicToc:
         Raises
           none
         """
-        if label not in self.labels:
-            self.tic(label)
-        if self.qtoc(label) > 1:
-            print(msg)
-            self.tic(label)
+        label = str(label or '_default')
+        if label not in self._progress:
+            self._progress[label] = Progress(total, interval, msg or label)
+        self._progress[label].update(count)
+        return self
+
+
+class Progress:
+    """
+    Progress reporter for loops over a known or unknown number of items.
+    update() counts items done, and at most every interval seconds prints
+    the count, the rate in items/s (an exponential moving average over the
+    reporting intervals, weighted by smoothing) and, if total is known, the
+    percentage done and the ETA.
+
+    update() reads the cheapest clock there is (time.time() on Python 2,
+    where the monotonic clock costs some microseconds through ctypes) and
+    does nothing else until a report is due, so it can be called once per
+    item in tight loops, and reports stay on time when items get slower.
+
+    >>> progress = Progress(total=len(seq), msg='features')
+    >>> for item in seq:
+    ...     process(item)
+    ...     progress.update()
+    >>> progress.finish()
+    """
+
+    def __init__(self, total=None, interval=1, msg='progress', smoothing=0.3,
+                 stream=None):
+        self.total = total
+        self.interval = interval
+        self.msg = msg
+        self.smoothing = smoothing
+        self.stream = stream
+        self.count = 0
+        self.rate = None
+        self.start = _progress_clock()
+        self._last_time = self.start
+        self._last_count = 0
+
+    def update(self, count=1):
+        """
+        Count <count> more items done, and print progress if it is due.
+
+        Returns:
+          self
+        """
+        self.count += count
+        now = _progress_clock()
+        if now - self._last_time >= self.interval:
+            self._update_rate(now)
+            self._print(self._line(now))
+        return self
+
+    def _update_rate(self, now):
+        rate = (self.count - self._last_count) / max(now - self._last_time,
+                                                     1e-9)
+        if self.rate is None:
+            self.rate = rate
+        else:
+            self.rate = self.smoothing * rate + (1 - self.smoothing) * self.rate
+        self._last_time = now
+        self._last_count = self.count
+
+    @property
+    def eta(self):
+        """
+        Estimated seconds left, or None if total or the rate is unknown.
+        """
+        if self.total is None or not self.rate:
+            return None
+        return max(self.total - self.count, 0) / self.rate
+
+    def _line(self, now):
+        if self.total:
+            done = "%d/%d (%.1f%%)" % (self.count, self.total,
+                                       100. * self.count / self.total)
+        else:
+            done = "%d" % self.count
+        line = "%s: %s, %.1f items/s, elapsed %.1f s" % (
+            self.msg, done, self.rate or 0., now - self.start)
+        if self.eta is not None:
+            line += ", ETA %.1f s" % self.eta
+        return line
+
+    def _print(self, line):
+        stream = self.stream or sys.stdout
+        stream.write(line + '\n')
+        stream.flush()
+
+    def finish(self):
+        """
+        Print the total count, time and mean rate.
+
+        Returns:
+          elapsed (float): seconds since the Progress was created
+        """
+        elapsed = _progress_clock() - self.start
+        self._print("%s: %d items in %.1f s, %.1f items/s" % (
+            self.msg, self.count, elapsed, self.count / max(elapsed, 1e-9)))
+        return elapsed
+
+
+class _ThreadState(threading.local):
+    """
+    Scope stack and tic() paths of one thread, for TicToc.
+    """
+
+    def __init__(self):
+        self.scopes = []
+        self.tic_paths = {}
+
+
+class _Scope:
+    """
+    Context manager returned by TicToc.scope().
+    """
+
+    def __init__(self, tictoc, label):
+        self.tictoc = tictoc
+        self.label = label
+
+    def __enter__(self):
+        tictoc = self.tictoc
+        scopes = tictoc._local.scopes
+        scopes.append(self.label)
+        self.path = tuple(scopes)
+        self.sampled = tictoc.sample_every == 1 or tictoc._sample(self.path)
+        if self.sampled:
+            self.start = clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.sampled:
+            self.tictoc.record(self.path, clock() - self.start, self.start)
+        else:
+            self.tictoc._label_stats(self.path).skipped += 1
+        self.tictoc._local.scopes.pop()
+        return False
+
+
+def _mpi_rank():
+    """
+    Return the MPI rank of this process if mpi4py.MPI has been imported and
+    initialized, else None. Does not import mpi4py itself.
+    """
+    MPI = sys.modules.get('mpi4py.MPI')
+    if MPI is None or not MPI.Is_initialized() or MPI.Is_finalized():
+        return None
+    return MPI.COMM_WORLD.Get_rank()
+
+
+class _NullScope:
+    """
+    Context manager that does nothing, returned by disabled TicToc.scope().
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SCOPE = _NullScope()
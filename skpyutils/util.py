@@ -5,14 +5,24 @@ Sergey Karayev - http://sergeykarayev.com
 
 import os
 import sys
+import signal
 import subprocess
+import threading
+import Queue
 import operator
+import types
 import time
 import json
+import hashlib
+import cPickle
+import functools
+import itertools
+import collections
 import numpy as np
-import scipy.stats as st
-from collections import Counter
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from skpyutils.table import Table
+from skpyutils.tictoc import Progress
 
 
 class Report:
@@ -64,45 +74,320 @@ def filter_on_column(arr, ind, val, op=operator.eq, omit=False):
     return arr
 
 
-def collect(seq, func, kwargs=None, with_index=False, index_col_name=None):
+def collect(seq, func, kwargs=None, with_index=False, index_col_name=None,
+            num_workers=None, use_threads=False, chunksize=1, cache=None,
+            progress=None):
     """
     Take a sequence seq of arguments to function func.
       - func should return a Table or an ndarray.
       - kwargs is a dictionary of arguments that will be passed to func.
 
-    Return the outputs of func concatenated vertically into an np.array
-    (thereby making copies of the collected data).
+    Return the outputs of func concatenated vertically into an np.array.
     If the outputs are Tables, concatenate the arrays and return a Table.
+    The outputs are copied once, in order, into a buffer that grows as needed.
 
     If with_index is True, append index column to outputs.
     If the outputs are Tables, index_col_name must be provided for this purpose.
+
+    If num_workers > 1, func is run over seq in a pool of that many processes
+    (or threads, if use_threads), handing out chunksize items at a time.
+    For processes, func and kwargs must be picklable: func must be defined
+    at module level.
+
+    If cache (a CollectCache) is given, the output for each item is loaded
+    from it if present, and func is only run on the remaining items, whose
+    outputs are then stored in it.
+
+    If progress is True (or a tictoc.Progress), report the number of items
+    done, the rate and the ETA every second while collecting.
     """
-    all_results = []
+    if progress is True:
+        total = len(seq) if hasattr(seq, '__len__') else None
+        progress = Progress(total, msg='collect')
+    all_results = _RowBuffer()
     cols = None
-    for index, image in enumerate(seq):
-        results = func(image, **kwargs) if kwargs else func(image)
-        if isinstance(results, Table):
-            cols = results.cols
-            results = results.arr
-        if results.shape[0] > 0:
-            if with_index:
-                all_results.append(append_index_column(results, index))
-            else:
-                all_results.append(results)
-    ret = np.array([])
-    if len(all_results) > 0:
-        ret = np.vstack(all_results)
+    call = functools.partial(_call_with_kwargs, func, kwargs)
+    if cache is not None:
+        seq = list(seq)
+        keys = [cache.key(func, kwargs, item) for item in seq]
+        is_cached = [cache.contains(key) for key in keys]
+        todo = [item for item, c in zip(seq, is_cached) if not c]
+    else:
+        todo = seq
+    pool = None
+    if num_workers > 1:
+        pool = ThreadPool(num_workers) if use_threads else Pool(num_workers)
+        results_seq = pool.imap(call, todo, chunksize)
+    else:
+        results_seq = itertools.imap(call, todo)
+    if cache is not None:
+        results_seq = cache.merge(keys, is_cached, results_seq, seq, call)
+    try:
+        for index, results in enumerate(results_seq):
+            if isinstance(results, Table):
+                cols = results.cols
+                results = results.arr
+            if results.shape[0] > 0:
+                all_results.append(results, index if with_index else None)
+            if progress:
+                progress.update()
+    finally:
+        if pool is not None:
+            pool.terminate()
+    if progress:
+        progress.finish()
+    if cache is not None:
+        print("collect: %d cached, %d computed; %r" % (
+            sum(is_cached), len(todo), cache))
+    ret = all_results.finish()
     if cols:
-        assert(index_col_name)
-        ret = Table(ret, list(cols + [index_col_name]))
+        if with_index:
+            assert(index_col_name)
+            cols = cols + [index_col_name]
+        ret = Table(ret, list(cols))
     return ret
 
 
-def collect_with_index(seq, func, kwargs=None, index_col_name=None):
+def collect_with_index(seq, func, kwargs=None, index_col_name=None,
+                       num_workers=None, use_threads=False, chunksize=1,
+                       cache=None, progress=None):
     """
     See collect().
     """
-    return collect(seq, func, kwargs, True, index_col_name)
+    return collect(seq, func, kwargs, True, index_col_name,
+                   num_workers, use_threads, chunksize, cache, progress)
+
+
+def _call_with_kwargs(func, kwargs, item):
+    """
+    Module-level helper to collect(), so that it can be pickled.
+    """
+    return func(item, **kwargs) if kwargs else func(item)
+
+
+class CollectCache:
+    """
+    On-disk cache of the outputs of func for individual items of seq in
+    collect(), keyed by func (its name and code), kwargs and the item.
+    Outputs are stored in binary .npy format (see Table.save_npy()).
+    When the total size of the stored files goes over max_bytes, the least
+    recently used outputs are deleted.
+    Counts of hits and misses are kept, and printed by collect().
+
+    The key covers the bytecode, constants, defaults and closure of func
+    (and the function and arguments of a functools.partial), but not the
+    functions it calls: clear() the cache after changing those.
+    """
+
+    def __init__(self, dirname, max_bytes=None):
+        self.dirname = makedirs(dirname)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    def __repr__(self):
+        return "CollectCache(%s): %d hits, %d misses, %d bytes" % (
+            self.dirname, self.hits, self.misses, self.total_bytes)
+
+    def key(self, func, kwargs, item):
+        """
+        Return key for the output of func(item, **kwargs).
+        """
+        func_id = CollectCache._func_id(func)
+        kwargs_items = sorted(kwargs.items()) if kwargs else []
+        try:
+            data = cPickle.dumps((func_id, kwargs_items, item), 2)
+        except (cPickle.PicklingError, TypeError):
+            data = repr((func_id, kwargs_items, item))
+        return hashlib.sha1(data).hexdigest()
+
+    @staticmethod
+    def _func_id(func):
+        """
+        Return picklable identity of func, for key().
+
+        Raises:
+          ValueError for callables other than functions, methods, builtins
+          and functools.partial, whose identity cannot be determined.
+        """
+        if isinstance(func, functools.partial):
+            return ('partial', CollectCache._func_id(func.func), func.args,
+                    sorted((func.keywords or {}).items()))
+        if hasattr(func, '__func__'):
+            return ('method', CollectCache._func_id(func.__func__),
+                    type(func.__self__).__name__)
+        name = (getattr(func, '__module__', None),
+                getattr(func, '__name__', None))
+        if hasattr(func, '__code__'):
+            closure = [cell.cell_contents for cell in func.__closure__ or []]
+            return name + (CollectCache._code_id(func.__code__),
+                           func.__defaults__, closure)
+        if isinstance(func, (types.BuiltinFunctionType, np.ufunc)):
+            return name
+        raise ValueError("Cannot key the outputs of %r in CollectCache" %
+                         (func,))
+
+    @staticmethod
+    def _code_id(code):
+        """
+        Return bytecode and constants of code, with those of nested code
+        objects (e.g. lambdas defined inside it).
+        """
+        consts = tuple(CollectCache._code_id(c) if isinstance(c, types.CodeType)
+                       else c for c in code.co_consts)
+        return (code.co_code, consts, code.co_names)
+
+    def contains(self, key):
+        return os.path.exists(self._filename(key))
+
+    def load(self, key):
+        """
+        Return stored output for key, or None if there is none.
+        Counts a hit or miss, and marks the output as recently used.
+        """
+        filename = self._filename(key)
+        try:
+            if os.path.exists(filename[:-len('.npy')] + '.json'):
+                output = Table.load_from_npy(filename, mmap_mode=None)
+            else:
+                output = np.load(filename)
+            os.utime(filename, None)
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return output
+
+    def store(self, key, output):
+        """
+        Store output (an ndarray or a Table) for key, then evict the least
+        recently used outputs if over max_bytes.
+        """
+        filename = self._filename(key)
+        if isinstance(output, Table):
+            output.save_npy(filename)
+        else:
+            np.save(filename, output)
+        self.total_bytes += sum(size for name, _, size in self._entries(key))
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def merge(self, keys, is_cached, computed, seq, call):
+        """
+        Helper to collect(): generator of outputs for all keys in order,
+        loading the cached ones and storing the ones taken from computed.
+        An output that was evicted since the check is recomputed with call.
+        """
+        for key, hit, item in zip(keys, is_cached, seq):
+            output = self.load(key) if hit else None
+            if output is None:
+                if hit:
+                    output = call(item)
+                else:
+                    self.misses += 1
+                    output = computed.next()
+                self.store(key, output)
+            yield output
+
+    def clear(self):
+        """
+        Delete all stored outputs.
+        """
+        for key, _, _ in self._entries():
+            self._remove(key)
+        self.total_bytes = 0
+
+    def _filename(self, key):
+        return os.path.join(self.dirname, key + '.npy')
+
+    def _remove(self, key):
+        for ext in ['.npy', '.json']:
+            filename = os.path.join(self.dirname, key + ext)
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def _entries(self, key=None):
+        """
+        Return list of (key, last used time, size in bytes) of stored outputs,
+        or only of the output for key, if given.
+        """
+        entries = {}
+        names = os.listdir(self.dirname) if key is None else \
+            [key + '.npy', key + '.json']
+        for name in names:
+            filename = os.path.join(self.dirname, name)
+            if not os.path.exists(filename):
+                continue
+            stat = os.stat(filename)
+            name_key = os.path.splitext(name)[0]
+            mtime, size = entries.get(name_key, (0, 0))
+            entries[name_key] = (max(mtime, stat.st_mtime), size + stat.st_size)
+        return [(k, mtime, size) for k, (mtime, size) in entries.items()]
+
+    def _evict(self):
+        """
+        Delete least recently used outputs until under max_bytes.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self.total_bytes = sum(size for _, _, size in entries)
+        for key, _, size in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._remove(key)
+            self.total_bytes -= size
+
+
+class _RowBuffer:
+    """
+    Helper to collect(): preallocated array that rows are appended to,
+    doubling its capacity when full.
+    """
+
+    def __init__(self):
+        self.arr = None
+        self.num_rows = 0
+
+    def append(self, rows, index=None):
+        """
+        Append rows of 2-D (or a 1-D, as a single row) array, and if index is
+        not None, an extra last column containing index.
+
+        Raises:
+          ValueError if the number of columns differs from the first rows'.
+        """
+        rows = np.atleast_2d(rows)
+        num_cols = rows.shape[1] + (index is not None)
+        if self.arr is not None and num_cols != self.arr.shape[1]:
+            raise ValueError(
+                "Rows of %d columns cannot be appended to rows of %d" % (
+                    num_cols, self.arr.shape[1]))
+        dtype = rows.dtype if index is None else \
+            np.result_type(rows.dtype, float)
+        if self.arr is None:
+            self.arr = np.empty((max(rows.shape[0], 16), num_cols), dtype)
+        elif np.result_type(self.arr, dtype) != self.arr.dtype:
+            self.arr = self.arr.astype(np.result_type(self.arr, dtype))
+        end = self.num_rows + rows.shape[0]
+        if end > self.arr.shape[0]:
+            arr = np.empty((max(end, 2 * self.arr.shape[0]), num_cols),
+                           self.arr.dtype)
+            arr[:self.num_rows] = self.arr[:self.num_rows]
+            self.arr = arr
+        self.arr[self.num_rows:end, :rows.shape[1]] = rows
+        if index is not None:
+            self.arr[self.num_rows:end, -1] = index
+        self.num_rows = end
+
+    def finish(self):
+        """
+        Return the appended rows, or np.array([]) if there are none.
+        """
+        if self.arr is None:
+            return np.array([])
+        # shrinks in place, without another copy where possible
+        self.arr.resize((self.num_rows, self.arr.shape[1]), refcheck=False)
+        return self.arr
 
 
 def random_subset_up_to_N(N, max_num=None):
@@ -162,23 +447,85 @@ def makedirs(dirname):
     return dirname
 
 
-def importance_sample(dist, num_points, kde=None):
+def importance_sample(dist, num_points, kde=None, method='kde',
+                      grid_size=None, cache=True):
     """
     dist is a list of numbers drawn from some distribution.
     If kde is given, uses it, otherwise computes own.
     Return num_points points to sample this dist at, spaced such that
     approximately the same area is between each pair of sample points.
+
+    The density is evaluated on a grid of grid_size points between the min
+    and max of dist, with
+      - method='kde': a scipy.stats.gaussian_kde, by default on 50 points;
+      - method='binned': a Gaussian KDE with the same bandwidth, computed
+        by binning dist onto the grid (1024 points by default) and
+        convolving with the kernel by FFT, in O(N + grid_size log grid_size)
+        instead of O(N x grid_size).
+    If cache, the cumulative density for the last few dists (by content) is
+    kept, and repeated calls only interpolate.
     """
-    if not kde:
-        kde = st.gaussian_kde(dist.T)
-    x = np.linspace(np.min(dist), np.max(dist))
-    y = kde.evaluate(x)
-    ycum = np.cumsum(y)
+    if grid_size is None:
+        grid_size = 50 if method == 'kde' else 1024
+    key = None
+    if cache and kde is None:
+        dist = np.ascontiguousarray(dist)
+        key = (hashlib.sha1(dist).hexdigest(), dist.shape, dist.dtype.str,
+               method, grid_size)
+    if key in _density_cache:
+        x, ycum = _density_cache.pop(key)
+    else:
+        x = np.linspace(np.min(dist), np.max(dist), grid_size)
+        if method == 'kde':
+            if not kde:
+                import scipy.stats as st
+                kde = st.gaussian_kde(dist.T)
+            y = kde.evaluate(x)
+        elif method == 'binned':
+            y = _binned_kde(np.ravel(dist), x)
+        else:
+            raise ValueError("Unknown method %s" % method)
+        ycum = np.cumsum(y)
+    if key is not None:
+        _density_cache[key] = (x, ycum)
+        while len(_density_cache) > _DENSITY_CACHE_SIZE:
+            _density_cache.popitem(last=False)
     points = np.interp(
         np.linspace(np.min(ycum), np.max(ycum), num_points), xp=ycum, fp=x)
     return points
 
 
+# cumulative densities of importance_sample(), least recently used first
+_density_cache = collections.OrderedDict()
+_DENSITY_CACHE_SIZE = 8
+
+
+def _binned_kde(values, x):
+    """
+    Return the (unnormalized) Gaussian KDE of values at the evenly spaced
+    points x, with the bandwidth of scipy.stats.gaussian_kde (Scott's rule).
+    values are linearly binned onto x, and the bins convolved with the
+    kernel by FFT.
+    """
+    n = len(x)
+    dx = x[1] - x[0] if n > 1 else 0.
+    bandwidth = np.std(values, ddof=1) * len(values) ** (-1 / 5.)
+    if dx == 0 or not bandwidth > 0:
+        return np.ones(n)
+    # linear binning: each value is split between its two nearest points
+    t = (values - x[0]) / dx
+    i = np.minimum(t.astype(int), n - 2)
+    frac = t - i
+    counts = np.bincount(i, 1 - frac, n) + np.bincount(i + 1, frac, n)
+    # kernel out to 5 bandwidths, or the whole grid
+    k = int(min(n - 1, np.ceil(5 * bandwidth / dx)))
+    kernel = np.exp(-0.5 * (np.arange(-k, k + 1) * dx / bandwidth) ** 2)
+    size = 1 << int(np.ceil(np.log2(n + 2 * k + 1)))
+    conv = np.fft.irfft(np.fft.rfft(counts, size) * np.fft.rfft(kernel, size),
+                        size)
+    return np.maximum(conv[k:k + n], 0)
+
+
 def fequal(a, b, tol=.0000001):
     """
     Return True if the two floats are very close in value, and False
@@ -256,77 +603,300 @@ def cartesian(arrays, out=None):
 
     """
 
-    arrays = [np.asarray(x) for x in arrays]
+    arrays = [np.asarray(x).ravel() for x in arrays]
     dtype = arrays[0].dtype
+    sizes = [x.size for x in arrays]
 
-    n = np.prod([x.size for x in arrays])
+    n = int(np.prod(sizes))
     if out is None:
         out = np.zeros([n, len(arrays)], dtype=dtype)
+    if not out.flags.c_contiguous:
+        out[...] = cartesian(arrays)
+        return out
+
+    # fill each column in place through a (before, size, after) view of out
+    before = 1
+    for j, x in enumerate(arrays):
+        after = n / (before * x.size) if n else 0
+        view = out.reshape((before, x.size, after, len(arrays)))
+        view[:, :, :, j] = x[np.newaxis, :, np.newaxis]
+        before *= x.size
+    return out
+
 
-    m = n / arrays[0].size
-    out[:, 0] = np.repeat(arrays[0], m)
-    if arrays[1:]:
-        cartesian(arrays[1:], out=out[0:m, 1:])
-        for j in xrange(1, arrays[0].size):
-            out[j * m:(j + 1) * m, 1:] = out[0:m, 1:]
+def cartesian_size(arrays):
+    """
+    Return the number of rows of cartesian(arrays).
+    """
+    return int(np.prod([np.size(x) for x in arrays]))
+
+
+def cartesian_rows(arrays, inds):
+    """
+    Return rows inds (an int or array of ints) of cartesian(arrays), without
+    computing the others: the digits of each row index in the mixed radix
+    of the array sizes index the arrays.
+
+    >>> cartesian_rows(([1, 2, 3], [4, 5], [6, 7]), [0, 5])
+    array([[1, 4, 6],
+           [2, 4, 7]])
+    """
+    arrays = [np.asarray(x).ravel() for x in arrays]
+    inds = np.atleast_1d(inds)
+    out = np.empty((len(inds), len(arrays)), dtype=arrays[0].dtype)
+    if len(inds):
+        digits = np.unravel_index(inds, [x.size for x in arrays])
+        for j, (x, digit) in enumerate(zip(arrays, digits)):
+            out[:, j] = x[digit]
     return out
 
 
-# TODO: replace with numpy method
+def iter_cartesian(arrays, chunk_size=100000, part=0, num_parts=1):
+    """
+    Generate the rows of cartesian(arrays) in blocks of up to chunk_size
+    rows, in the same order, without materializing the whole product.
+
+    With num_parts > 1, only the part-th of num_parts contiguous ranges of
+    rows is generated, e.g. part=mpi.comm_rank, num_parts=mpi.comm_size to
+    split the product across MPI ranks.
+    """
+    n = cartesian_size(arrays)
+    start = n * part // num_parts
+    stop = n * (part + 1) // num_parts
+    for i in xrange(start, stop, chunk_size):
+        yield cartesian_rows(arrays, np.arange(i, min(i + chunk_size, stop)))
+
+
 def determine_bin(data, bounds, asInt=True):
     """
     For data and given bounds, determine in which bin each point falls.
+    Bin i holds the values in [bounds[i], bounds[i+1]); values below
+    bounds[1] fall in the first bin and values from bounds[-2] up (including
+    bounds[-1] and NaN) in the last one.
     asInt=True: return number of bin each val falls in
     asInt=False: return representative value for each val (center between bounds)
     """
-    num_bins = bounds.shape[0] - 1
-    ret_tab = np.zeros((data.shape[0], 1))
-    col_bin = np.zeros((data.shape[0], 1))
-    bin_values = np.zeros(bounds.shape)
-    last_val = 0.
+    bins = _bin_inds(data, bounds)
+    if asInt:
+        return bins.astype(float)
+    bin_values = (bounds[:-1] + bounds[1:]) / 2.
+    return bin_values[bins][:, np.newaxis]
+
 
-    for bidx, b in enumerate(bounds):
-        bin_values[bidx] = (last_val + b) / 2.
-        if bidx == 0:
-            continue
-        last_val = b
-        col_bin += np.matrix(data < b, dtype=int).T
+def _bin_inds(data, bounds):
+    """
+    Return int array of the bins of data, as in determine_bin().
+    """
+    return np.searchsorted(bounds[1:-1], np.asarray(data).ravel(),
+                           side='right')
 
-    bin_values = bin_values[1:]
-    col_bin[col_bin == 0] = 1
 
-    if asInt:
-        a = num_bins - col_bin
-        ret_tab = a[:, 0]
+def bin_counts(data, bounds, weights=None):
+    """
+    Return float array of the number of data values in each bin given by
+    bounds (see determine_bin()), or of the sums of their weights.
+    """
+    return np.bincount(_bin_inds(data, bounds), weights,
+                       len(bounds) - 1).astype(float)
+
+
+def histogram2d(x, y, x_bounds, y_bounds, weights=None):
+    """
+    Return float array of shape (len(x_bounds) - 1, len(y_bounds) - 1) of
+    the number of (x, y) pairs in each pair of bins (see determine_bin()),
+    or of the sums of their weights.
+    """
+    shape = (len(x_bounds) - 1, len(y_bounds) - 1)
+    inds = np.ravel_multi_index(
+        (_bin_inds(x, x_bounds), _bin_inds(y, y_bounds)), shape)
+    return np.bincount(inds, weights, shape[0] * shape[1]).astype(
+        float).reshape(shape)
+
+
+def histogram_chunks(chunks, bounds, y_bounds=None):
+    """
+    Return the bin_counts() (or, given y_bounds, histogram2d()) of data
+    that comes in chunks, without holding more than one chunk in memory,
+    e.g. from Table.load_from_csv_in_chunks() or slices of a memory-mapped
+    array.
+
+    Args:
+      chunks (iterable): arrays of values, or tuples of
+        (values, weights), or for 2-D histograms (x, y) or (x, y, weights)
+
+      bounds (ndarray): bin bounds of the values (or x)
+
+      y_bounds (ndarray): [optional] bin bounds of y for 2-D histograms
+    """
+    if y_bounds is None:
+        counts = np.zeros(len(bounds) - 1)
+        for chunk in chunks:
+            if isinstance(chunk, tuple):
+                counts += bin_counts(chunk[0], bounds, chunk[1])
+            else:
+                counts += bin_counts(chunk, bounds)
     else:
-        for rowdex in range(data.shape[0]):
-            ret_tab[rowdex, 0] = bin_values[int(col_bin[rowdex] - 1)]
-    return ret_tab
+        counts = np.zeros((len(bounds) - 1, len(y_bounds) - 1))
+        for chunk in chunks:
+            counts += histogram2d(chunk[0], chunk[1], bounds, y_bounds,
+                                  chunk[2] if len(chunk) > 2 else None)
+    return counts
 
 
-def histogram(x, num_bins, normalize=False):
+def histogram(x, num_bins, normalize=False, weights=None):
     """
     compute a histogram for x = np.array and num_bins bins
-    assumpt: x is already binned up
+    spanning the values of x evenly, optionally of the given weights
     """
+    x = np.asarray(x)
     bounds = np.linspace(np.min(x), np.max(x), num_bins + 1)
-    x = determine_bin(x, bounds)
-    return histogram_just_count(x, num_bins, normalize)
+    histogram = np.matrix(bin_counts(x, bounds, weights))
+    if normalize:
+        histogram = histogram / np.sum(histogram)
+    return histogram
 
 
 def histogram_just_count(x, num_bins, normalize=False):
-    if hasattr(x, 'shape'):
-        # This is a np object
-        if x.ndim > 1:
-            x = np.hstack(x)
-    counts = Counter(x)
-    histogram = [counts.get(x, 0) for x in range(num_bins)]
-    histogram = np.matrix(histogram, dtype='float64')
+    """
+    compute a histogram for x = np.array and num_bins bins
+    assumpt: x is already binned up, values outside range(num_bins) are
+    ignored
+    """
+    x = np.asarray(x).ravel()
+    x = x[(x >= 0) & (x < num_bins) & (x == np.floor(x))]
+    histogram = np.matrix(np.bincount(x.astype(int), minlength=num_bins),
+                          dtype='float64')
     if normalize:
         histogram = histogram / np.sum(histogram)
     return histogram
 
 
+class Histogram:
+    """
+    Histogram that is accumulated batch by batch with add(), e.g. as the
+    outputs of collect() or run_tasks() come in, and can be merged with
+    the Histograms of other processes or ranks.
+
+    With bounds, the bins are fixed, and values are binned as in
+    determine_bin(). Without, num_bins equal bins are fitted to the range
+    of the first batch, and whenever a value falls outside, the bin width
+    is doubled (merging pairs of bins) until the range covers it. Values
+    that are not finite (NaN, inf, -inf) are then not binned, only counted
+    in nonfinite.
+
+    histogram() returns the counts like histogram_just_count() does.
+    """
+
+    def __init__(self, num_bins, bounds=None):
+        self.num_bins = num_bins
+        self.counts = np.zeros(num_bins)
+        self.adaptive = bounds is None
+        self.nonfinite = 0
+        self.lo = None
+        self.width = None
+        if bounds is not None:
+            bounds = np.asarray(bounds, dtype=float)
+            assert(len(bounds) == num_bins + 1)
+        self._bounds = bounds
+
+    def __repr__(self):
+        return "Histogram(%d bins, %s): %g in total" % (
+            self.num_bins, 'adaptive' if self.adaptive else 'fixed',
+            self.counts.sum())
+
+    @property
+    def bounds(self):
+        """
+        Array of the num_bins + 1 bin bounds, or None if an adaptive
+        Histogram has no values yet.
+        """
+        if self.adaptive and self.lo is not None:
+            return self.lo + self.width * np.arange(self.num_bins + 1)
+        return self._bounds
+
+    def add(self, values, weights=None):
+        """
+        Count values (an array of any shape), or sum their weights.
+
+        Returns:
+          self
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        if self.adaptive:
+            valid = np.isfinite(values)
+            if not valid.all():
+                self.nonfinite += len(values) - np.count_nonzero(valid)
+                values = values[valid]
+                if weights is not None:
+                    weights = np.asarray(weights).ravel()[valid]
+            if len(values) == 0:
+                return self
+            self._cover(values.min(), values.max())
+        elif weights is not None:
+            weights = np.asarray(weights).ravel()
+        self.counts += bin_counts(values, self.bounds, weights)
+        return self
+
+    def _cover(self, lo, hi):
+        """
+        Grow the bins of an adaptive Histogram until [lo, hi] is in range.
+        """
+        n = self.num_bins
+        if self.lo is None:
+            self.lo = lo
+            # a tiny width for a single value, grown by doubling as needed
+            self.width = (hi - lo) / n or (abs(lo) or 1.) * 2 ** -20
+            while lo + self.width * n < hi:
+                # rounding
+                self.width = np.nextafter(self.width, np.inf)
+        while lo < self.lo or hi > self.lo + self.width * n:
+            # old bin i goes to new bin (i + offset) // 2, offset even
+            offset = 0
+            if lo < self.lo:
+                offset = n - n % 2
+            self.counts = np.bincount((np.arange(n) + offset) // 2,
+                                      self.counts, n).astype(float)
+            self.lo -= offset * self.width
+            self.width *= 2
+
+    def merge(self, other):
+        """
+        Add the counts of another Histogram with the same num_bins. Fixed
+        bounds must be the same. Adaptive Histograms are re-binned to cover
+        both ranges, with the counts of other's bins going to the bin of
+        their centers (exact when the bins line up, e.g. when both started
+        from the same first batch).
+
+        Returns:
+          self
+        """
+        assert(self.num_bins == other.num_bins)
+        self.nonfinite += other.nonfinite
+        if not self.adaptive:
+            if not np.array_equal(self.bounds, other.bounds):
+                raise ValueError(
+                    "Cannot merge Histograms with different bounds")
+            self.counts += other.counts
+            return self
+        if other.bounds is None:
+            return self
+        other_bounds = other.bounds
+        self._cover(other_bounds[0], other_bounds[-1])
+        centers = (other_bounds[:-1] + other_bounds[1:]) / 2.
+        self.counts += bin_counts(centers, self.bounds, other.counts)
+        return self
+
+    def histogram(self, normalize=False):
+        """
+        Return the counts as an np.matrix of shape (1, num_bins), normalized
+        to sum to 1 if normalize.
+        """
+        histogram = np.matrix(self.counts, dtype='float64')
+        if normalize:
+            histogram = histogram / np.sum(histogram)
+        return histogram
+
+
 def run_matlab_script(matlab_script_dir, function_string):
     """
     Takes a directory where the desired script is, changes dir to it, runs it with the given function and parameter string, and then chdirs back to where we were.
@@ -343,6 +913,7 @@ def run_matlab_script(matlab_script_dir, function_string):
 def run_command(command, loud=True):
     """
     Runs the passed string as a shell command. If loud, outputs the command and the times. If say exists, outputs it as well. Returns the retcode of the shell command.
+    To run many commands concurrently, see run_commands().
     """
     retcode = -1
     if loud:
@@ -364,5 +935,114 @@ def run_command(command, loud=True):
     return retcode
 
 
+def run_commands(commands, num_workers=4, timeout=None, fail_fast=False,
+                 loud=False):
+    """
+    Run the passed strings as shell commands, up to num_workers at a time,
+    capturing the stdout and stderr of each.
+
+    Args:
+      commands (list of strings): shell commands, run with /bin/bash
+
+      num_workers (int): [optional] maximum number of concurrent commands
+
+      timeout (float): [optional] seconds after which a command (and its
+        children) is killed
+
+      fail_fast (bool): [optional] if True, after the first command that
+        fails or times out, kill the running commands and start no more
+
+      loud (bool): [optional] output each command and its elapsed time, as
+        run_command() does
+
+    Returns:
+      list of dicts, one per command and in the same order, with keys
+        'command', 'returncode' (None if it was never run, negative if it
+        was killed by a signal), 'stdout', 'stderr', 'start' (time.time()),
+        'duration' (seconds) and 'timed_out'.
+    """
+    results = [{'command': command, 'returncode': None, 'stdout': '',
+                'stderr': '', 'start': None, 'duration': 0.,
+                'timed_out': False} for command in commands]
+    todo = Queue.Queue()
+    for i in range(len(commands)):
+        todo.put(i)
+    stop = threading.Event()
+    running = {}
+    lock = threading.Lock()
+
+    def kill(proc):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def on_timeout(result, proc):
+        result['timed_out'] = True
+        kill(proc)
+
+    def work():
+        while not stop.is_set():
+            try:
+                i = todo.get_nowait()
+            except Queue.Empty:
+                return
+            result = results[i]
+            if loud:
+                with lock:
+                    print >>sys.stdout, "%s: Running command %s" % (
+                        curtime(), result['command'])
+            result['start'] = time.time()
+            try:
+                # own process group, so that timeouts kill the whole tree
+                proc = subprocess.Popen(
+                    result['command'], shell=True, executable="/bin/bash",
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    preexec_fn=os.setsid)
+            except OSError, e:
+                result['returncode'] = -1
+                result['stderr'] = str(e)
+            else:
+                with lock:
+                    running[i] = proc
+                if stop.is_set():
+                    kill(proc)
+                timer = None
+                if timeout is not None:
+                    timer = threading.Timer(timeout, on_timeout,
+                                            (result, proc))
+                    timer.start()
+                result['stdout'], result['stderr'] = proc.communicate()
+                if timer is not None:
+                    timer.cancel()
+                result['returncode'] = proc.returncode
+                with lock:
+                    del running[i]
+            result['duration'] = time.time() - result['start']
+            if loud:
+                with lock:
+                    print >>sys.stdout, (
+                        "%s: Finished running command %s (returned %d). "
+                        "Elapsed time: %f" % (
+                            curtime(), result['command'],
+                            result['returncode'], result['duration']))
+            if fail_fast and result['returncode'] != 0 and not stop.is_set():
+                stop.set()
+                with lock:
+                    for proc in running.values():
+                        kill(proc)
+
+    threads = [threading.Thread(target=work)
+               for _ in range(max(1, min(num_workers, len(commands))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        # join with a timeout so that KeyboardInterrupt gets through
+        while thread.is_alive():
+            thread.join(0.1)
+    return results
+
+
 def curtime():
     return time.strftime("%c %Z")
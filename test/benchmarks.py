@@ -0,0 +1,300 @@
+"""
+Benchmarks for the performance-sensitive parts of skpyutils.
+
+Run all of them with
+    python benchmarks.py
+or only some of them with
+    python benchmarks.py load_from_csv ...
+"""
+from context import *
+from skpyutils import Table, TicToc
+
+import shutil
+import tempfile
+import time
+
+
+def bench_load_from_csv(sizes=(1000000, 10000000), num_cols=6):
+  """
+  Compare Table.load_from_csv against the np.loadtxt loader it replaced.
+  """
+  dirname = tempfile.mkdtemp()
+  tt = TicToc()
+  try:
+    for N in sizes:
+      filename = os.path.join(dirname, 'table.csv')
+      with open(filename, 'w') as f:
+        f.write("%s\nbench\n" % ','.join('c%d' % i for i in range(num_cols)))
+        for i in range(0, N, 100000):
+          np.savetxt(f, np.random.rand(min(100000, N - i), num_cols), delimiter=',')
+      print("load_from_csv: %d rows x %d cols" % (N, num_cols))
+
+      tt.tic('loadtxt')
+      arr = np.loadtxt(filename, delimiter=',', skiprows=2)
+      tt.toc('loadtxt')
+      del arr
+
+      tt.tic('load_from_csv')
+      t = Table.load_from_csv(filename)
+      tt.toc('load_from_csv')
+      del t
+
+      tt.tic('load_from_csv_in_chunks')
+      total = 0
+      for t in Table.load_from_csv_in_chunks(filename):
+        total += t.shape[0]
+      assert(total == N)
+      tt.toc('load_from_csv_in_chunks')
+  finally:
+    shutil.rmtree(dirname)
+
+
+def _sleep_for(duration):
+  time.sleep(duration)
+  return np.array([[duration]])
+
+
+def bench_run_tasks(num_items=200, mean_duration=0.01):
+  """
+  Compare makespan of the static split of common_mpi.collect() with the
+  master/worker common_mpi.run_tasks() on skewed task durations.
+  Run under MPI, e.g. mpirun -n 4 python benchmarks.py run_tasks
+  """
+  from skpyutils import common_mpi as mpi
+  # every 10th task takes 10x as long, and they land on the same rank
+  # under a static split if the number of ranks divides 10
+  durations = np.tile(mean_duration, num_items)
+  durations[::10] *= 10
+  durations = mpi.comm.bcast(durations)
+
+  mpi.comm.Barrier()
+  t = time.time()
+  mpi.collect(durations, _sleep_for, schedule='static')
+  static = time.time() - t
+
+  mpi.comm.Barrier()
+  t = time.time()
+  outputs, stats = mpi.run_tasks(durations, _sleep_for, chunksize=1)
+  dynamic = time.time() - t
+  if mpi.comm_rank == 0:
+    print("run_tasks: %d items on %d ranks, total work %.2f s" % (
+      num_items, mpi.comm_size, durations.sum()))
+    print("static collect makespan: %.3f s" % static)
+    print("run_tasks makespan: %.3f s" % dynamic)
+    print(stats)
+
+
+def _cpu_time():
+  t = os.times()
+  return t[0] + t[1]
+
+
+def bench_barrier(num_iters=200, straggler_delay=0.02):
+  """
+  Compare latency and CPU usage of common_mpi.safebarrier() with
+  comm.Barrier(), when all ranks arrive together and when rank 0 is late.
+  Run under MPI at various rank counts, e.g.
+    mpirun -n 8 python benchmarks.py barrier
+  """
+  from skpyutils import common_mpi as mpi
+  barriers = [('comm.Barrier', mpi.comm.Barrier), ('safebarrier', mpi.safebarrier)]
+  for name, barrier in barriers:
+    barrier()
+    t, cpu = time.time(), _cpu_time()
+    for i in range(num_iters):
+      barrier()
+    latency = (time.time() - t) / num_iters
+    barrier()
+
+    t, cpu = time.time(), _cpu_time()
+    for i in range(num_iters / 10):
+      if mpi.comm_rank == 0:
+        time.sleep(straggler_delay)
+      barrier()
+    # CPU use of the ranks waiting for the straggler
+    cpu_fraction = (_cpu_time() - cpu) / (time.time() - t)
+
+    stats = mpi.comm.gather((latency, cpu_fraction))
+    if mpi.comm_rank == 0:
+      stats = np.array(stats)
+      print("%s on %d ranks: latency %.1f us, waiting CPU use %.0f%%" % (
+        name, mpi.comm_size, 1e6 * stats[:, 0].max(), 100 * stats[1:, 1].mean()))
+
+
+def bench_table_transfer(sizes_mb=(100, 1000), num_cols=10):
+  """
+  Compare buffer-based common_mpi.bcast_table() and gather_table() with
+  pickled comm.bcast() and comm.gather() of the Table.
+  Run under MPI, e.g. mpirun -n 4 python benchmarks.py table_transfer
+  """
+  from skpyutils import common_mpi as mpi
+  for size_mb in sizes_mb:
+    num_rows = size_mb * 2 ** 20 / (8 * num_cols)
+    table = None
+    if mpi.comm_rank == 0:
+      table = Table(np.random.rand(num_rows, num_cols),
+                    ['c%d' % i for i in range(num_cols)], None, 'bench')
+    timings = []
+    for name, transfer in [('comm.bcast', lambda t: mpi.comm.bcast(t)),
+                           ('bcast_table', mpi.bcast_table)]:
+      mpi.comm.Barrier()
+      t = time.time()
+      result = transfer(table)
+      mpi.comm.Barrier()
+      timings.append((name, time.time() - t))
+      del result
+    part = mpi.scatter_table(table)
+    del table
+    for name, transfer in [('comm.gather', lambda t: mpi.comm.gather(t)),
+                           ('gather_table', mpi.gather_table)]:
+      mpi.comm.Barrier()
+      t = time.time()
+      result = transfer(part)
+      mpi.comm.Barrier()
+      timings.append((name, time.time() - t))
+      del result
+    if mpi.comm_rank == 0:
+      print("table_transfer: %d MB table on %d ranks" % (size_mb, mpi.comm_size))
+      for name, duration in timings:
+        print("  %s: %.3f s" % (name, duration))
+
+
+def bench_tictoc_overhead(num_calls=200000):
+  """
+  Per-call cost of timing an empty block with TicToc, enabled, sampled and
+  disabled, against the bare loop.
+  """
+  def loop(tt):
+    t = time.time()
+    for i in xrange(num_calls):
+      with tt.scope('s'):
+        pass
+      tt.tic('a')
+      tt.toc('a', quiet=True)
+    return (time.time() - t) / num_calls
+
+  t = time.time()
+  for i in xrange(num_calls):
+    pass
+  base = (time.time() - t) / num_calls
+  print("tictoc_overhead: %d calls of scope() and tic()/toc()" % num_calls)
+  for name, tt in [('enabled', TicToc()),
+                   ('sampled 1/100', TicToc().set_sampling(100)),
+                   ('disabled', TicToc().set_enabled(False))]:
+    print("  %s: %.2f us per iteration" % (name, 1e6 * (loop(tt) - base)))
+
+
+def _loop_histogram(x, num_bins):
+  """
+  The histogram() of before the searchsorted/bincount rewrite, for
+  comparison: a comparison matrix per bound, then a Counter.
+  """
+  from collections import Counter
+  bounds = np.linspace(np.min(x), np.max(x), num_bins + 1)
+  col_bin = np.zeros((x.shape[0], 1))
+  for b in bounds[1:]:
+    col_bin += np.matrix(x < b, dtype=int).T
+  col_bin[col_bin == 0] = 1
+  counts = Counter((num_bins - col_bin)[:, 0])
+  return np.matrix([counts.get(i, 0) for i in range(num_bins)], dtype='float64')
+
+
+def bench_histogram(sizes=(100000, 1000000, 10000000), num_bins=100,
+                    max_loop_size=1000000):
+  """
+  histogram() against the previous implementation, and histogram_chunks()
+  over 1M-value chunks.
+  """
+  from skpyutils import util
+  for N in sizes:
+    x = np.random.randn(N)
+    print("histogram: %d values, %d bins" % (N, num_bins))
+    tt = TicToc()
+    h = util.histogram(x, num_bins)
+    t = tt.qtoc()
+    print("  histogram: %.3f s" % t)
+    if N <= max_loop_size:
+      tt.tic()
+      assert_equal(_loop_histogram(x, num_bins), h)
+      print("  previous histogram: %.3f s" % tt.qtoc())
+    bounds = np.linspace(x.min(), x.max(), num_bins + 1)
+    tt.tic()
+    chunks = (x[i:i + 1000000] for i in xrange(0, N, 1000000))
+    assert_equal(util.histogram_chunks(chunks, bounds), np.asarray(h)[0])
+    print("  histogram_chunks: %.3f s" % tt.qtoc())
+
+
+def bench_importance_sample(sizes=(10000, 100000, 1000000), num_points=20):
+  """
+  importance_sample() with the exact and binned KDEs, and a cached repeat
+  call. Accuracy is the largest distance of the points from those of the
+  exact KDE on the same grid, and from the quantiles of the data the
+  points are meant to approximate, in standard deviations.
+  """
+  from skpyutils import util
+  for N in sizes:
+    dist = np.random.randn(N)
+    quantiles = np.percentile(dist, np.linspace(0, 100, num_points))
+    print("importance_sample: %d values, %d points" % (N, num_points))
+    tt = TicToc()
+    exact = util.importance_sample(dist, num_points, cache=False)
+    print("  kde, 50 points: %.3f s, from quantiles %.3f" % (
+      tt.qtoc(), np.abs(exact - quantiles)[1:-1].max()))
+    for grid_size in [50, 1024]:
+      tt.tic()
+      points = util.importance_sample(dist, num_points, method='binned',
+                                      grid_size=grid_size, cache=False)
+      print("  binned, %d points: %.3f s, from kde %.3f, from quantiles %.3f" % (
+        grid_size, tt.qtoc(), np.abs(points - exact).max(),
+        np.abs(points - quantiles)[1:-1].max()))
+    util.importance_sample(dist, num_points)
+    tt.tic()
+    util.importance_sample(dist, num_points)
+    print("  kde, cached: %.3f s" % tt.qtoc())
+
+
+def _recursive_cartesian(arrays, out=None):
+  """
+  The cartesian() of before the in-place rewrite, for comparison.
+  """
+  arrays = [np.asarray(x) for x in arrays]
+  n = np.prod([x.size for x in arrays])
+  if out is None:
+    out = np.zeros([n, len(arrays)], dtype=arrays[0].dtype)
+  m = n / arrays[0].size
+  out[:, 0] = np.repeat(arrays[0], m)
+  if arrays[1:]:
+    _recursive_cartesian(arrays[1:], out=out[0:m, 1:])
+    for j in xrange(1, arrays[0].size):
+      out[j * m:(j + 1) * m, 1:] = out[0:m, 1:]
+  return out
+
+
+def bench_cartesian(shapes=((10, 10, 10, 10, 10, 10, 10), (1000, 1000, 10),
+                            (2, ) * 20)):
+  """
+  cartesian() against the previous recursive implementation, and
+  iter_cartesian() in 1M-row chunks.
+  """
+  from skpyutils import util
+  for shape in shapes:
+    arrays = [np.arange(n, dtype=float) for n in shape]
+    print("cartesian: %d rows x %d cols" % (util.cartesian_size(arrays), len(arrays)))
+    tt = TicToc()
+    out = util.cartesian(arrays)
+    print("  cartesian: %.3f s" % tt.qtoc())
+    tt.tic()
+    assert_equal(_recursive_cartesian(arrays), out)
+    print("  previous cartesian: %.3f s" % tt.qtoc())
+    tt.tic()
+    for chunk in util.iter_cartesian(arrays, 1000000):
+      pass
+    print("  iter_cartesian: %.3f s" % tt.qtoc())
+
+
+if __name__ == '__main__':
+  names = sys.argv[1:]
+  benchmarks = sorted(k for k in globals() if k.startswith('bench_'))
+  for name in benchmarks:
+    if not names or name[len('bench_'):] in names:
+      globals()[name]()
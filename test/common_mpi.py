@@ -0,0 +1,219 @@
+"""
+Run with a single process, or under MPI:
+    mpirun -n 4 python -m nose common_mpi.py
+"""
+from context import *
+from skpyutils import common_mpi as mpi
+from skpyutils import util
+from skpyutils.table import Table
+from skpyutils.tictoc import TicToc
+
+import time
+
+def _rows_for(n, scale=1):
+  return np.column_stack((np.arange(n), np.ones(n) * n)) * scale
+
+def _slow_rows_for(n):
+  # uneven item costs
+  time.sleep(0.001 * (n % 7))
+  return _rows_for(n)
+
+def _table_for(n):
+  return Table(_rows_for(n), ['a','b'])
+
+class Collect(unittest.TestCase):
+  def test_collect(self):
+    seq = [3, 0, 1, 2, 5, 0, 4, 1, 2, 6]
+    for schedule in ['static', 'dynamic']:
+      arr = mpi.collect(seq, _rows_for, {'scale': 2}, schedule=schedule)
+      if mpi.comm_rank == 0:
+        assert_equal(arr, util.collect(seq, _rows_for, {'scale': 2}))
+      else:
+        assert(arr is None)
+
+      arr = mpi.collect_with_index(seq * 5, _slow_rows_for, schedule=schedule, chunksize=3)
+      if mpi.comm_rank == 0:
+        assert_equal(arr, util.collect_with_index(seq * 5, _rows_for))
+
+      t = mpi.collect_with_index(seq, _table_for, index_col_name='ind', schedule=schedule)
+      if mpi.comm_rank == 0:
+        t2 = util.collect_with_index(seq, _table_for, index_col_name='ind')
+        assert(t.cols == t2.cols)
+        assert_equal(t.arr, t2.arr)
+
+      arr = mpi.collect([0, 0], _rows_for, schedule=schedule)
+      if mpi.comm_rank == 0:
+        assert_equal(arr, np.array([]))
+
+    self.assertRaises(ValueError, mpi.collect, seq, _rows_for, schedule='guided')
+
+  def test_dynamic_slow_root(self):
+    # the other ranks are not held up by a slow root
+    def rows_for(n):
+      time.sleep(0.5 if mpi.comm_rank == 0 else 0.01)
+      return _rows_for(n)
+    seq = range(30)
+    t = time.time()
+    arr = mpi.collect(seq, rows_for, schedule='dynamic')
+    if mpi.comm_rank == 0:
+      assert_equal(arr, util.collect(seq, _rows_for))
+    if mpi.comm_size > 1:
+      assert(time.time() - t < 0.5 + 30 * 0.01)
+
+class Collectives(unittest.TestCase):
+  def test_safe_collectives(self):
+    # a straggler makes the others back off
+    if mpi.comm_rank == 0:
+      time.sleep(0.05)
+    mpi.safebarrier()
+
+    arr = np.arange(12.).reshape((3,4)) if mpi.comm_rank == 0 else None
+    arr = mpi.safebcast(arr)
+    assert_equal(arr, np.arange(12.).reshape((3,4)))
+
+    local = np.arange(5) + mpi.comm_rank
+    total = mpi.safereduce(local)
+    if mpi.comm_rank == 0:
+      assert_equal(total, sum(np.arange(5) + r for r in range(mpi.comm_size)))
+    else:
+      assert(total is None)
+    total = mpi.safereduce(local, mpi.MPI.MAX, root=mpi.comm_size - 1)
+    if mpi.comm_rank == mpi.comm_size - 1:
+      assert_equal(total, np.arange(5) + mpi.comm_size - 1)
+
+    gathered = mpi.safeallgather(local)
+    assert_equal(gathered, [np.arange(5) + r for r in range(mpi.comm_size)])
+
+    # scalars and empty arrays
+    scalar = mpi.safebcast(np.array(3.) if mpi.comm_rank == 0 else None)
+    assert(scalar.shape == () and scalar == 3)
+    assert(mpi.safebcast(np.zeros((0,2)) if mpi.comm_rank == 0 else None).shape == (0,2))
+    assert_equal(mpi.safeallgather(np.array(mpi.comm_rank)), range(mpi.comm_size))
+    assert(mpi.safeallgather(np.zeros((0,2))).shape == (mpi.comm_size,0,2))
+    assert_equal(mpi.allreduce_array(local), sum(np.arange(5) + r for r in range(mpi.comm_size)))
+
+class TableTransfer(unittest.TestCase):
+  def test_arrays(self):
+    full = np.arange(30.).reshape((10,3))
+    arr = mpi.bcast_array(full if mpi.comm_rank == 0 else None)
+    assert_equal(arr, full)
+    assert_equal(mpi.bcast_array(np.zeros((0,3)) if mpi.comm_rank == 0 else None), np.zeros((0,3)))
+
+    part = mpi.scatter_array(full if mpi.comm_rank == 0 else None)
+    assert_equal(part, np.array_split(full, mpi.comm_size)[mpi.comm_rank])
+    gathered = mpi.gather_array(part)
+    if mpi.comm_rank == 0:
+      assert_equal(gathered, full)
+    else:
+      assert(gathered is None)
+
+    # empty parts and mixed dtypes are fine
+    part = np.arange(3)[np.newaxis, :] if mpi.comm_rank % 2 else np.array([])
+    gathered = mpi.gather_array(part, root=mpi.comm_size - 1)
+    if mpi.comm_rank == mpi.comm_size - 1:
+      assert_equal(gathered.reshape((-1,3)), np.tile(np.arange(3), (mpi.comm_size / 2, 1)))
+    gathered = mpi.gather_array(np.array([]))
+    if mpi.comm_rank == 0:
+      assert_equal(gathered, np.array([]))
+
+    total = mpi.allreduce_array(np.ones((2,2)) * mpi.comm_rank)
+    assert_equal(total, np.ones((2,2)) * sum(range(mpi.comm_size)))
+
+  def test_tables(self):
+    full = Table(np.arange(30.).reshape((10,3)), ['a','b','c'],
+                 ['r%d' % i for i in range(10)], 'test_table')
+    t = mpi.bcast_table(full if mpi.comm_rank == 0 else None)
+    assert(t == full and t.index == full.index and t.name == full.name)
+
+    part = mpi.scatter_table(full if mpi.comm_rank == 0 else None)
+    assert_equal(part.arr, np.array_split(full.arr, mpi.comm_size)[mpi.comm_rank])
+    assert(part.index == [full.index[int(i) / 3] for i in part.arr[:, 0]])
+    assert(part.cols == full.cols and part.name == full.name)
+    t = mpi.gather_table(part)
+    if mpi.comm_rank == 0:
+      assert(t == full and t.index == full.index)
+    else:
+      assert(t is None)
+
+    # with fewer rows than ranks some parts have an empty index
+    small = Table(full.arr[:2], full.cols, full.index[:2], full.name)
+    part = mpi.scatter_table(small if mpi.comm_rank == 0 else None)
+    t = mpi.gather_table(part)
+    if mpi.comm_rank == 0:
+      assert(t == small and t.index == small.index)
+
+    t = mpi.allreduce_table(full)
+    assert_equal(t.arr, full.arr * mpi.comm_size)
+    assert(t.cols == full.cols and t.index == full.index)
+
+class SharedTable(unittest.TestCase):
+  def test_shared_table(self):
+    full = Table(np.arange(30.).reshape((10,3)), ['a','b','c'],
+                 ['r%d' % i for i in range(10)], 'test_table')
+    for root in [0, mpi.comm_size - 1]:
+      t, win = mpi.shared_table(full if mpi.comm_rank == root else None, root=root)
+      assert(t == full and t.index == full.index and t.name == full.name)
+      assert(not t.arr.flags.writeable)
+
+      # all ranks on the node see the same memory
+      mpi.comm.Barrier()
+      if mpi.comm_rank == root:
+        t.arr.flags.writeable = True
+        t.arr[0, 0] = -1
+      mpi.comm.Barrier()
+      assert(t.arr[0, 0] == -1)
+      mpi.comm.Barrier()
+      win.Free()
+
+    t, win = mpi.shared_table(loader=lambda: full)
+    assert(t == full and not t.arr.flags.writeable)
+    win.Free()
+
+    t, win = mpi.shared_table(Table(np.zeros((0,3)), ['a','b','c']))
+    assert(t.shape == (0,3) and t.cols == ['a','b','c'])
+    win.Free()
+
+class RunTasks(unittest.TestCase):
+  def test_run_tasks(self):
+    seq = range(20)
+    for chunksize in [1, 3]:
+      arrived = []
+      outputs, stats = mpi.run_tasks(seq, _slow_rows_for, chunksize=chunksize,
+                                     callback=lambda i, output: arrived.append(i))
+      if mpi.comm_rank == 0:
+        assert(len(outputs) == len(seq))
+        for n, output in zip(seq, outputs):
+          assert_equal(output, _rows_for(n))
+        assert(sorted(arrived) == seq)
+        assert(stats.shape == (mpi.comm_size, 4))
+        assert(stats.cols == ['items', 'busy', 'wall', 'utilization'])
+        assert(stats.subset_arr('items').sum() == len(seq))
+        assert(np.all(stats.subset_arr('utilization') <= 1))
+      else:
+        assert(outputs is None and stats is None)
+
+class GatherTicToc(unittest.TestCase):
+  def test_gather_tictoc(self):
+    tt = TicToc()
+    with tt.scope('stage'):
+      # the last rank is the straggler
+      tt.record(('stage', 'work'), 1. + (mpi.comm_rank == mpi.comm_size - 1))
+    if mpi.comm_rank == 0:
+      tt.record(('root_only',), 0.5)
+    summary = mpi.report_tictoc(tt)
+    if mpi.comm_rank != 0:
+      assert(summary is None)
+      return
+    assert(summary.index == ['root_only', 'stage', 'stage/work'])
+    rows = dict(zip(summary.index, summary.arr))
+    work = dict(zip(summary.cols, rows['stage/work']))
+    assert(work['ranks'] == mpi.comm_size and work['calls'] == mpi.comm_size)
+    assert(work['max'] == 2 and work['max_rank'] == mpi.comm_size - 1)
+    if mpi.comm_size > 1:
+      assert(work['min'] == 1 and work['imbalance'] > 1)
+    root_only = dict(zip(summary.cols, rows['root_only']))
+    assert(root_only['ranks'] == 1 and root_only['max_rank'] == 0)
+    assert_almost_equal(root_only['mean'], 0.5 / mpi.comm_size)
+
+if __name__ == '__main__':
+  unittest.main()
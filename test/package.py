@@ -0,0 +1,53 @@
+from context import *
+
+import subprocess
+
+_IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, %r)
+t = time.time()
+import %s
+print time.time() - t
+print ' '.join(sorted(sys.modules))
+"""
+
+def _import_in_subprocess(modules):
+  """
+  Return the seconds taken to import modules in a fresh interpreter, and
+  the set of modules it then has loaded.
+  """
+  root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+  output = subprocess.check_output(
+    [sys.executable, '-c', _IMPORT_SCRIPT % (root, modules)])
+  duration, loaded = output.splitlines()[-2:]
+  return float(duration), set(loaded.split())
+
+class Import(unittest.TestCase):
+  def test_lazy_import(self):
+    duration, loaded = _import_in_subprocess('skpyutils')
+    for name in ['mpi4py.MPI', 'scipy.stats', 'skpyutils.common_mpi',
+                 'skpyutils.util', 'multiprocessing']:
+      assert(name not in loaded)
+    # importing the package must stay much cheaper than its heavy dependencies
+    heavy_duration, _ = _import_in_subprocess('skpyutils, scipy.stats, mpi4py.MPI')
+    assert(duration < heavy_duration / 2)
+
+  def test_lazy_names(self):
+    import skpyutils
+    from skpyutils import Table, TicToc, mpi, skutil
+    import skpyutils.common_mpi
+    assert(skpyutils.mpi is mpi is skpyutils.common_mpi)
+    assert(skutil.collect and mpi.comm_size >= 1)
+    self.assertRaises(AttributeError, getattr, skpyutils, 'missing')
+
+    # the submodules are also reachable by their own names, in an
+    # interpreter where nothing has imported them yet
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    output = subprocess.check_output([sys.executable, '-c', (
+      "import sys; sys.path.insert(0, %r); import skpyutils; "
+      "print skpyutils.util is skpyutils.skutil, "
+      "skpyutils.common_mpi is skpyutils.mpi") % root])
+    assert(output.split()[-2:] == ['True', 'True'])
+
+if __name__ == '__main__':
+  unittest.main()
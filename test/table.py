@@ -1,5 +1,5 @@
 from context import *
-from skpyutils.table import Table
+from skpyutils.table import Table, Column
 
 import operator
 
@@ -205,3 +205,297 @@ def overall_and_subset_test():
   assert(t3.shape == arr2.shape and np.all(t3.arr == arr2) and t3.cols == cols2 and t3.index == index2 and t3.name == name2)
   t3_arr = t2.row_subset(1).subset_arr(1)
   assert(np.all(t3_arr==np.array([0.3])))
+
+def save_load_npy_test():
+  import tempfile, shutil
+  arr = np.array([
+    [0.2, 0.3, 0.4],
+    [0.1, 0.3, 0.6],
+    [0.6, 0.3, 1./3]])
+  cols = ['a','b','c']
+  index = ['one','two','three']
+  name = 'test_table'
+  t = Table(arr, cols, index, name)
+
+  dirname = tempfile.mkdtemp()
+  try:
+    filename = os.path.join(dirname, 'table')
+    t.save_npy(filename)
+
+    # memory-mapped by default, and exactly equal
+    t2 = Table.load_from_npy(filename)
+    assert(isinstance(t2.arr, np.memmap))
+    assert(t2.shape == arr.shape and np.all(t2.arr == arr) and t2.cols == cols and t2.index == index and t2.name == name)
+
+    # modifying the loaded table does not modify the file
+    t2.arr[0,:] = 1
+    t3 = Table.load_from_npy(filename + '.npy', mmap_mode=None)
+    assert(not isinstance(t3.arr, np.memmap))
+    assert(np.all(t3.arr == arr) and t3.cols == cols and t3.index == index)
+
+    # empty table without index
+    t = Table(np.zeros((0,3)), cols, None, name)
+    t.save_npy(filename)
+    t2 = Table.load_from_npy(filename)
+    assert(t2.shape == (0,3) and t2.cols == cols and t2.index is None and t2.name == name)
+  finally:
+    shutil.rmtree(dirname)
+
+def load_from_csv_test():
+  import tempfile, shutil
+  arr = np.random.rand(25, 3)
+  cols = ['a','b','c']
+  name = 'test_table'
+
+  dirname = tempfile.mkdtemp()
+  try:
+    filename = os.path.join(dirname, 'table.csv')
+    with open(filename, 'w') as f:
+      f.write("%s\n%s\n" % (','.join(cols), name))
+      np.savetxt(f, arr, delimiter=',')
+
+    t = Table.load_from_csv(filename, chunk_size=10)
+    assert(t.shape == arr.shape and np.allclose(t.arr, arr) and t.cols == cols and t.name == name)
+
+    chunks = list(Table.load_from_csv_in_chunks(filename, chunk_size=10))
+    assert([c.shape[0] for c in chunks] == [10, 10, 5])
+    assert(all(c.cols == cols and c.name == name for c in chunks))
+    assert(np.allclose(np.vstack([c.arr for c in chunks]), arr))
+
+    # single row, blank lines and no newline at end of file
+    with open(filename, 'w') as f:
+      f.write("a,b,c\ntest_table\n\n1,2,3")
+    t = Table.load_from_csv(filename)
+    assert(t.shape == (1,3) and np.all(t.arr == np.array([[1,2,3]])))
+
+    # no data rows
+    with open(filename, 'w') as f:
+      f.write("a,b,c\ntest_table\n")
+    t = Table.load_from_csv(filename)
+    assert(t.shape == (0,3) and t.cols == cols)
+    assert(len(list(Table.load_from_csv_in_chunks(filename))) == 0)
+
+    # wrong number of values in a row
+    with open(filename, 'w') as f:
+      f.write("a,b,c\ntest_table\n1,2,3\n1,2\n")
+    assert_raises(ValueError, Table.load_from_csv, filename)
+    # even when the total number of values fits
+    with open(filename, 'w') as f:
+      f.write("a,b,c\ntest_table\n1,2\n3,4,5,6\n")
+    assert_raises(ValueError, Table.load_from_csv, filename)
+    # and non-numeric, empty or trailing garbage values
+    for line in ["1,2,x\n", "1,,3\n", "1,2,\n", "1,2,3x"]:
+      with open(filename, 'w') as f:
+        f.write("a,b,c\ntest_table\n4,5,6\n" + line)
+      assert_raises(ValueError, Table.load_from_csv, filename)
+      assert_raises(ValueError, list, Table.load_from_csv_in_chunks(filename))
+  finally:
+    shutil.rmtree(dirname)
+
+def name_inds_test():
+  arr = np.arange(12.).reshape((4,3))
+  cols = ['a','b','c']
+  index = ['one','two','three','one']
+  t = Table(arr, cols, index, 'test_table')
+
+  assert(t.ind('c') == 2)
+  assert(t.name_inds(['c','a']) == [2,0])
+  # duplicate names resolve to the first position, like list.index()
+  assert(t.name_inds(['three','one'], axis=0) == [2,0])
+  assert_raises(ValueError, t.ind, 'd')
+  assert_raises(ValueError, t.name_inds, ['four'], 0)
+
+  # lookups stay correct when the lists are modified in place or replaced
+  t.cols[0] = 'big A'
+  assert(t.ind('big A') == 0)
+  assert_raises(ValueError, t.ind, 'a')
+  t.index.append('five')
+  assert(t.name_inds(['five'], axis=0) == [4])
+  t.index = ['w','x','y','z']
+  assert(t.name_inds(['z','w'], axis=0) == [3,0])
+
+  # and on derived tables
+  t2 = t.sort_by_column('big A', descending=True)
+  assert(t2.name_inds(['z','w'], axis=0) == [0,3])
+  t3 = t2.filter_on_column('c', 5, operator.gt, omit=True)
+  assert(t3.cols == ['big A','b'] and t3.index == ['z','y'])
+  assert(t3.name_inds(['y'], axis=0) == [1])
+  t4 = t3.append_column('d', [1,2])
+  assert(t4.ind('d') == 2 and t4.name_inds(['y'], axis=0) == [1])
+  assert(np.all(t4.row_subset(['y','z']).arr == np.array([[6,7,2],[9,10,1]])))
+
+def view_test():
+  arr = np.arange(20.).reshape((5,4))
+  t = Table(arr, ['a','b','c','d'], ['r0','r1','r2','r3','r4'], 'test_table')
+
+  # contiguous columns are returned as read-only views
+  t2 = t.subset(['b','c'], view=True)
+  assert(t2.cols == ['b','c'] and np.all(t2.arr == arr[:, 1:3]))
+  assert(np.may_share_memory(t2.arr, arr) and not t2.arr.flags.writeable)
+  assert_raises(ValueError, t2.arr.__setitem__, (0,0), 1)
+  # mutating requires an explicit copy, which leaves the original alone
+  t3 = t2.copy()
+  t3.arr[0,0] = -1
+  assert(arr[0,1] == 1)
+
+  # evenly spaced rows and masks with one run of True values
+  t2 = t.row_subset([0,2,4], view=True)
+  assert(t2.index == ['r0','r2','r4'] and np.may_share_memory(t2.arr, arr))
+  t2 = t.filter_on_column('a', 8, operator.ge, view=True)
+  assert(t2.index == ['r2','r3','r4'] and np.may_share_memory(t2.arr, arr))
+  assert(np.all(t2.arr == t.filter_on_column('a', 8, operator.ge).arr))
+  t2 = t.filter_on_column('a', 8, operator.ge, omit=True, view=True)
+  assert(t2.cols == ['b','c','d'] and np.may_share_memory(t2.arr, arr))
+
+  # other selections, and the default, still copy
+  t2 = t.subset(['c','a'], view=True)
+  assert(np.all(t2.arr == arr[:, [2,0]]) and not np.may_share_memory(t2.arr, arr))
+  t2 = t.subset(np.array([True,False,True,True]), view=True)
+  assert(t2.cols == ['a','c','d'] and not np.may_share_memory(t2.arr, arr))
+  for t2 in [t.subset(['b','c']), t.filter_on_column('a', 8, operator.ge),
+             t.with_column_omitted('d')]:
+    assert(not np.may_share_memory(t2.arr, arr) and t2.arr.flags.writeable)
+
+  # out of range indices fail the same way with and without a view
+  for view in [False, True]:
+    for inds in [[3,4,5], [-7,-6], [5]]:
+      assert_raises(IndexError, t.row_subset, inds, view=view)
+  t2 = t.row_subset([-2,-1], view=True)
+  assert(t2.index == ['r3','r4'] and np.may_share_memory(t2.arr, arr))
+
+def filter_memory_test():
+  """
+  Filtering a table should not need memory for a full copy of it.
+  """
+  import subprocess
+  script = """
+import resource, operator, sys
+sys.path.insert(0, %r)
+import numpy as np
+from skpyutils.table import Table
+t = Table(np.random.rand(2000000, 10), ['c%%d' %% i for i in range(10)])
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t2 = t.filter_on_column('c0', 0.9, operator.gt)
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print((after - before) * 1024. / t.arr.nbytes)
+""" % os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+  growth = float(subprocess.check_output([sys.executable, '-c', script]))
+  # the filtered copy is ~10% of the table; a full copy would be 100%
+  assert(growth < 0.5)
+
+def query_test():
+  arr = np.array([
+    [0, 0.9, 1],
+    [1, 0.2, 2],
+    [2, 0.7, 3],
+    [3, 0.4, 1],
+    [4, 0.8, 2]])
+  t = Table(arr, ['x','score','cls'], ['r0','r1','r2','r3','r4'], 'test_table')
+
+  t2 = t.query(Column('score') > 0.5)
+  assert(t2.index == ['r0','r2','r4'] and t2.cols == t.cols and t2.name == t.name)
+  assert(t2 == t.filter_on_column('score', 0.5, operator.gt))
+
+  t2 = t.query((Column('score') > 0.5) & Column('cls').isin([1,2]))
+  assert(t2.index == ['r0','r4'] and np.all(t2.arr == arr[[0,4]]))
+
+  t2 = t.query(Column('x').between(1, 3) | (Column('cls') == 2))
+  assert(t2.index == ['r1','r2','r3','r4'])
+  t2 = t.query(Column('x').between(1, 3, inclusive=False))
+  assert(t2.index == ['r2'])
+
+  t2 = t.query(~(Column('cls') == 1) & (Column('x') != 4) & (Column('score') <= 0.7))
+  assert(t2.index == ['r1','r2'])
+
+  t2 = t.query(Column('score') >= 1)
+  assert(t2.shape == (0,3) and t2.index == [])
+  assert_raises(ValueError, t.query, Column('y') > 0)
+
+  # python's boolean operators would silently drop terms
+  assert_raises(TypeError, lambda: 1 < Column('x') < 3)
+  assert_raises(TypeError, lambda: (Column('x') > 1) and (Column('cls') == 2))
+  assert_raises(TypeError, lambda: not Column('x') > 1)
+
+def groupby_test():
+  arr = np.array([
+    [2, 0.5, 1],
+    [1, 0.2, 2],
+    [2, 0.7, 3],
+    [1, 0.4, 1],
+    [3, 0.8, 2],
+    [2, 0.1, 3]])
+  t = Table(arr, ['img','score','cls'], None, 'test_table')
+
+  t2 = t.groupby('img')
+  assert(t2.index is None and t2.cols == ['img','score','cls'] and t2.name == 'test_table')
+  assert_almost_equal(t2.arr, np.array([[1, 0.3, 1.5], [2, 1.3/3, 7./3], [3, 0.8, 2]]))
+
+  t2 = t.groupby('img', ['sum','count','min','max','argmax'])
+  assert(t2.cols == ['img','score_sum','cls_sum','count','score_min','cls_min',
+                     'score_max','cls_max','score_argmax','cls_argmax'])
+  assert_equal(t2.subset_arr('img'), [1, 2, 3])
+  assert_almost_equal(t2.subset_arr('score_sum'), [0.6, 1.3, 0.8])
+  assert_equal(t2.subset_arr('count'), [2, 3, 1])
+  assert_almost_equal(t2.subset_arr('score_min'), [0.2, 0.1, 0.8])
+  assert_almost_equal(t2.subset_arr('cls_max'), [2, 3, 2])
+  assert_equal(t2.subset_arr('score_argmax'), [3, 2, 4])
+  # ties go to the first row
+  assert_equal(t2.subset_arr('cls_argmax'), [1, 2, 4])
+
+  # same as looping over filter_on_column
+  for row in t2.arr:
+    assert_almost_equal(row[1:3], t.filter_on_column('img', row[0]).subset(['score','cls']).sum())
+
+  # the key column lets the groups be joined back to the rows
+  t3 = t.join(t.groupby('img', 'count'), 'img')
+  assert_equal(t3.subset_arr('count'), [3, 2, 3, 2, 1, 3])
+
+  # and the groups can be saved
+  import tempfile, shutil
+  dirname = tempfile.mkdtemp()
+  try:
+    filename = os.path.join(dirname, 'groups.csv')
+    t2.save_csv(filename)
+    t3 = Table.load_from_csv(filename)
+    assert(t3.cols == t2.cols and t3.name == t2.name)
+    assert_almost_equal(t3.arr, t2.arr)
+  finally:
+    shutil.rmtree(dirname)
+
+  t2 = Table(np.zeros((0,3)), ['img','score','cls']).groupby('img', ['max','count'])
+  assert(t2.shape == (0,4) and t2.cols == ['img','score_max','cls_max','count'])
+  assert_raises(ValueError, t.groupby, 'img', 'median')
+
+def join_test():
+  dets = Table(np.array([
+    [2, 0.5, 1],
+    [1, 0.2, 2],
+    [5, 0.7, 3],
+    [1, 0.4, 1]]), ['img','score','cls'], ['d0','d1','d2','d3'], 'dets')
+  gt = Table(np.array([
+    [1, 2, 10],
+    [2, 1, 20],
+    [1, 1, 30],
+    [3, 3, 40]]), ['img','cls','area'], None, 'gt')
+
+  t = dets.join(gt, 'img')
+  assert(t.cols == ['img','score','cls_left','cls_right','area'] and t.name == 'dets')
+  assert(t.index == ['d0','d1','d1','d3','d3'])
+  assert_equal(t.arr, np.array([
+    [2, 0.5, 1, 1, 20],
+    [1, 0.2, 2, 2, 10],
+    [1, 0.2, 2, 1, 30],
+    [1, 0.4, 1, 2, 10],
+    [1, 0.4, 1, 1, 30]]))
+
+  t = dets.join(gt, ['img','cls'], how='left')
+  assert(t.cols == ['img','score','cls','area'] and t.index == ['d0','d1','d2','d3'])
+  assert_equal(t.arr, np.array([
+    [2, 0.5, 1, 20],
+    [1, 0.2, 2, 10],
+    [5, 0.7, 3, np.nan],
+    [1, 0.4, 1, 30]]))
+
+  t = dets.join(Table(np.zeros((0,3)), ['img','cls','area']), 'img')
+  assert(t.shape == (0,5) and t.index == [])
+  assert_raises(ValueError, dets.join, gt, 'img', 'outer')
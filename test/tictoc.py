@@ -0,0 +1,194 @@
+from context import *
+from skpyutils.tictoc import TicToc, Progress
+
+import json
+import StringIO
+import time
+import threading
+import shutil
+import tempfile
+
+class Basic(unittest.TestCase):
+  def test_tic_toc(self):
+    tt = TicToc()
+    tt.tic('a')
+    time.sleep(0.01)
+    elapsed = tt.qtoc('a')
+    assert(elapsed >= 0.009)
+    assert(tt.qtoc() >= elapsed)
+    self.assertRaises(AssertionError, tt.toc, 'b')
+
+  def test_statistics(self):
+    tt = TicToc()
+    for i in range(5):
+      tt.tic('loop')
+      time.sleep(0.002 * i)
+      tt.qtoc('loop')
+    s = tt.stats[('loop',)]
+    assert(s.count == 5)
+    assert(s.min < 0.002 and s.max >= 0.008)
+    assert(s.min <= s.mean <= s.max)
+    assert_almost_equal(s.total, 5 * s.mean)
+    assert(s.min <= s.percentile(50) <= s.max)
+
+    summary = tt.summary()
+    assert(summary.index == ['loop'])
+    assert(summary.subset_arr('count') == 5)
+    assert_almost_equal(summary.subset_arr('total'), s.total)
+
+  def test_scopes(self):
+    tt = TicToc()
+
+    @tt.timed()
+    def work():
+      time.sleep(0.001)
+
+    with tt.scope('outer'):
+      for i in range(3):
+        with tt.scope('inner'):
+          work()
+      tt.tic('plain')
+      tt.qtoc('plain')
+    work()
+
+    summary = tt.summary()
+    assert(summary.index == ['outer', 'outer/inner', 'outer/inner/work', 'outer/plain', 'work'])
+    counts = dict(zip(summary.index, summary.subset_arr('count')))
+    assert(counts == {'outer': 1, 'outer/inner': 3, 'outer/inner/work': 3,
+                      'outer/plain': 1, 'work': 1})
+    totals = dict(zip(summary.index, summary.subset_arr('total')))
+    assert(totals['outer'] >= totals['outer/inner'] >= totals['outer/inner/work'] >= 0.003)
+
+    # scopes are closed on exceptions too
+    try:
+      with tt.scope('failing'):
+        raise ValueError()
+    except ValueError:
+      pass
+    assert(tt._local.scopes == [] and tt.stats[('failing',)].count == 1)
+    tt.report()
+
+  def test_thread_scopes(self):
+    tt = TicToc()
+
+    def work(name):
+      for i in range(20):
+        with tt.scope(name):
+          time.sleep(0.0005)
+          with tt.scope('inner'):
+            time.sleep(0.0005)
+
+    threads = [threading.Thread(target=work, args=('t%d' % i,)) for i in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    # each thread nests only in its own scopes
+    expected = set()
+    for i in range(4):
+      expected.update([('t%d' % i,), ('t%d' % i, 'inner')])
+    assert(set(tt.stats) - set([('_default',)]) == expected)
+    assert(tt._local.scopes == [])
+
+  def test_sampling(self):
+    tt = TicToc().set_sampling(4)
+    timed = [tt.tic('a').qtoc('a') for i in range(10)]
+    assert(all(isinstance(t, float) for t in timed))
+    assert(timed[1] == timed[0] and '%.3f' % timed[1])
+    for i in range(10):
+      with tt.scope('s'):
+        pass
+    for path in [('a',), ('s',)]:
+      s = tt.stats[path]
+      assert(s.count == 3 and s.skipped == 7 and s.calls == 10)
+      assert_almost_equal(s.estimated_total, 10 * s.mean)
+    summary = tt.summary()
+    assert(list(summary.subset_arr('calls')) == [10, 10])
+
+  def test_disabled(self):
+    tt = TicToc().set_enabled(False)
+
+    @tt.timed()
+    def work():
+      return 1
+    with tt.scope('s'):
+      assert(work() == 1)
+    assert(tt.tic('a').toc('a') == 0.)
+    assert(tt.stats == {})
+
+    tt.set_enabled()
+    tt.tic('a').qtoc('a')
+    assert(tt.stats[('a',)].count == 1)
+
+    TicToc.set_enabled_globally(False)
+    try:
+      other = TicToc()
+      for t in [tt, other]:
+        t.tic('b').qtoc('b')
+        assert(('b',) not in t.stats)
+    finally:
+      TicToc.set_enabled_globally(True)
+    other.tic('b').qtoc('b')
+    assert(other.stats[('b',)].count == 1)
+
+  def test_export(self):
+    tt = TicToc(max_spans=4)
+    with tt.scope('outer'):
+      for i in range(5):
+        tt.tic('a').qtoc('a')
+    assert(len(tt.spans) == 4 and tt.num_spans == 6)
+    dirname = tempfile.mkdtemp()
+    try:
+      filename = os.path.join(dirname, 'spans.jsonl')
+      assert(tt.export_jsonl(filename) == 4)
+      spans = [json.loads(line) for line in open(filename)]
+      assert([s['path'] for s in spans] == ['outer/a'] * 3 + ['outer'])
+      outer = spans[-1]
+      assert(all(outer['start'] <= s['start'] <= s['end'] <= outer['end']
+                 for s in spans[:-1]))
+      assert(abs(outer['start'] - time.time()) < 60)
+      assert(outer['pid'] == os.getpid() and outer['rank'] in (None, 0))
+
+      filename = os.path.join(dirname, 'trace.json')
+      assert(tt.export_chrome_trace(filename) == 4)
+      trace = json.load(open(filename))
+      events = trace['traceEvents']
+      assert([e['name'] for e in events] == ['a'] * 3 + ['outer'])
+      assert(all(e['ph'] == 'X' and e['dur'] >= 0 for e in events))
+      assert(trace['otherData']['dropped_spans'] == 2)
+    finally:
+      shutil.rmtree(dirname)
+
+  def test_progress(self):
+    stream = StringIO.StringIO()
+    progress = Progress(total=100000, interval=0.05, msg='items', stream=stream)
+    t = time.time()
+    for i in range(100000):
+      if i % 1000 == 0:
+        time.sleep(0.001)
+      progress.update()
+    # at most one line per interval
+    lines = stream.getvalue().splitlines()
+    assert(0 < len(lines) <= (time.time() - t) / 0.05 + 1)
+    assert(all(line.startswith('items: ') and 'items/s' in line for line in lines))
+    assert(progress.rate > 0 and progress.eta == 0)
+    assert(progress.finish() > 0)
+
+    # items that get slower after a fast stretch are still reported
+    stream = StringIO.StringIO()
+    progress = Progress(interval=0.1, stream=stream)
+    for i in range(2000):
+      progress.update()
+    for i in range(40):
+      time.sleep(0.02)
+      progress.update()
+    assert(len(stream.getvalue().splitlines()) >= 4)
+
+    tt = TicToc()
+    tt._progress['loop'] = Progress(total=3, interval=0, stream=stream)
+    for i in range(3):
+      assert(tt.running('loop', total=3) is tt)
+    assert(tt._progress['loop'].count == 3)
+
+if __name__ == '__main__':
+  unittest.main()
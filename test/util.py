@@ -2,6 +2,21 @@ from context import *
 from skpyutils import util
 
 import itertools
+import functools
+import time
+import StringIO
+from skpyutils.table import Table
+from skpyutils.tictoc import Progress
+
+def _rows_for(n, scale=1):
+  return np.column_stack((np.arange(n), np.ones(n) * n)) * scale
+
+def _table_for(n):
+  return Table(_rows_for(n), ['a','b'])
+
+class _Callable:
+  def __call__(self, n):
+    return _rows_for(n)
 
 class Basic(unittest.TestCase):
   def setUp(self):
@@ -90,6 +105,220 @@ class Basic(unittest.TestCase):
     assert(max(r)<=max(l))
     assert(min(r)>=min(l))
 
+  def test_collect(self):
+    seq = [3, 0, 1, 2]
+    expected = np.vstack([_rows_for(n) for n in seq])
+    expected_index = np.array([0,0,0,2,3,3])
+
+    assert_equal(util.collect(seq, _rows_for), expected)
+    assert_equal(util.collect(seq, _rows_for, {'scale': 2}), 2 * expected)
+    arr = util.collect_with_index(seq, _rows_for)
+    assert_equal(arr, np.hstack((expected, expected_index[:, np.newaxis])))
+
+    t = util.collect(seq, _table_for)
+    assert(t.cols == ['a','b'])
+    assert_equal(t.arr, expected)
+    t = util.collect_with_index(seq, _table_for, index_col_name='ind')
+    assert(t.cols == ['a','b','ind'])
+    assert_equal(t.subset_arr('ind'), expected_index)
+
+    # parallel collection gives the same results, in the same order
+    seq = range(30) * 3
+    arr = util.collect_with_index(seq, _rows_for)
+    for use_threads in [False, True]:
+      assert_equal(util.collect_with_index(
+        seq, _rows_for, num_workers=3, use_threads=use_threads, chunksize=4), arr)
+
+    assert_equal(util.collect([0, 0], _rows_for), np.array([]))
+    self.assertRaises(ValueError, util.collect, [3, 2], lambda n: np.ones((2, n)))
+
+  def test_collect_progress(self):
+    stream = StringIO.StringIO()
+    progress = Progress(total=4, interval=0, msg='rows', stream=stream)
+    seq = [3, 0, 1, 2]
+    assert_equal(util.collect(seq, _rows_for, progress=progress),
+                 util.collect(seq, _rows_for))
+    lines = stream.getvalue().splitlines()
+    assert(progress.count == 4 and len(lines) == 5)
+    assert(lines[0].startswith('rows: 1/4 (25.0%), ') and 'ETA' in lines[0])
+    assert(lines[-1].startswith('rows: 4 items in '))
+
+  def test_collect_cache(self):
+    import tempfile, shutil
+    dirname = tempfile.mkdtemp()
+    try:
+      cache = util.CollectCache(dirname)
+      seq = [3, 0, 1, 2]
+      arr = util.collect_with_index(seq, _rows_for, cache=cache)
+      assert_equal(arr, util.collect_with_index(seq, _rows_for))
+      assert(cache.hits == 0 and cache.misses == 4)
+
+      # only new items, and items with other kwargs, are computed
+      arr = util.collect_with_index(seq + [4], _rows_for, cache=cache)
+      assert_equal(arr, util.collect_with_index(seq + [4], _rows_for))
+      assert(cache.hits == 4 and cache.misses == 5)
+      arr = util.collect(seq, _rows_for, {'scale': 2}, cache=cache)
+      assert_equal(arr, util.collect(seq, _rows_for, {'scale': 2}))
+      assert(cache.hits == 4 and cache.misses == 9)
+
+      # Tables are cached with their cols
+      t = util.collect_with_index(seq, _table_for, index_col_name='ind', cache=cache)
+      t = util.collect_with_index(seq, _table_for, index_col_name='ind', cache=cache)
+      assert(cache.hits == 8 and t.cols == ['a','b','ind'])
+      assert_equal(t.arr, util.collect_with_index(seq, _rows_for))
+
+      # a cache that is reopened still has the outputs
+      cache = util.CollectCache(dirname)
+      assert(cache.total_bytes > 0)
+      util.collect(seq, _rows_for, num_workers=2, cache=cache)
+      assert(cache.hits == 4 and cache.misses == 0)
+
+      # least recently used outputs are evicted to stay under max_bytes
+      cache.clear()
+      assert(cache.total_bytes == 0 and len(os.listdir(dirname)) == 0)
+      cache = util.CollectCache(dirname, max_bytes=1)
+      util.collect(seq, _rows_for, cache=cache)
+      assert(cache.total_bytes <= 1)
+      assert_equal(util.collect(seq, _rows_for, cache=cache), util.collect(seq, _rows_for))
+
+      # functions with the same name but other code, constants, closures or
+      # partial arguments do not share outputs
+      cache = util.CollectCache(dirname)
+      assert_equal(util.collect([1, 2], lambda n: np.array([n]), cache=cache).ravel(), [1, 2])
+      assert_equal(util.collect([1, 2], lambda n: np.array([n * 100]), cache=cache).ravel(), [100, 200])
+      assert_equal(util.collect([1, 2], lambda n: np.array([n * 200]), cache=cache).ravel(), [200, 400])
+      for k in [3, 4]:
+        assert_equal(util.collect([1], lambda n: np.array([n * k]), cache=cache).ravel(), [k])
+      for scale in [2, 3]:
+        assert_equal(util.collect([1], functools.partial(_rows_for, scale=scale), cache=cache),
+                     _rows_for(1, scale))
+      assert(cache.hits == 0)
+      util.collect([1, 2], lambda n: np.array([n * 100]), cache=cache)
+      assert(cache.hits == 2)
+      self.assertRaises(ValueError, cache.key, _Callable(), None, 1)
+    finally:
+      shutil.rmtree(dirname)
+
+  def test_streaming_histogram(self):
+    data = np.random.randn(10000)
+    bounds = np.linspace(-2, 2, 11)
+    h = util.Histogram(10, bounds)
+    for i in range(0, 10000, 1000):
+      h.add(data[i:i + 1000])
+    assert_equal(h.histogram(), np.matrix(util.bin_counts(data, bounds)))
+    expected = util.histogram_just_count(util.determine_bin(data, bounds), 10, True)
+    assert_almost_equal(h.histogram(normalize=True), expected)
+
+    other = util.Histogram(10, bounds).add(data, weights=np.ones(10000))
+    assert_equal(h.merge(other).counts, 2 * other.counts)
+    self.assertRaises(ValueError, h.merge, util.Histogram(10, bounds + 1))
+
+    # adaptive bins cover all values, and merge exactly from the same start
+    h = util.Histogram(7)
+    assert(h.bounds is None)
+    h.add(data[:100])
+    first_bounds = h.bounds
+    assert(first_bounds[0] == data[:100].min())
+    assert(first_bounds[-1] >= data[:100].max())
+    for i in range(100, 10000, 1000):
+      h.add(data[i:i + 1000])
+    h.add([np.nan, 3 * data.min()])
+    assert(h.counts.sum() == 10001)
+    assert(h.bounds[0] <= 3 * data.min() and h.bounds[-1] >= data.max())
+    assert_equal(h.counts, util.bin_counts(np.append(data, 3 * data.min()), h.bounds))
+
+    other = util.Histogram(7).add(data[:100])
+    assert_equal(other.bounds, first_bounds)
+    other.add(data[100:] * 0.5)
+    merged = util.Histogram(7).merge(h).merge(other)
+    assert(merged.counts.sum() == 20001)
+    assert_equal(merged.counts, util.bin_counts(
+      np.concatenate((data, [3 * data.min()], data[:100], data[100:] * 0.5)), merged.bounds))
+
+    # infinite values are counted apart, and do not disturb the bins
+    h = util.Histogram(4).add([0, 1, np.inf, -np.inf, np.nan], [1, 1, 5, 5, 5])
+    h.add([-np.inf, 2])
+    assert(h.nonfinite == 4 and h.counts.sum() == 3)
+    assert(np.all(np.isfinite(h.bounds)) and h.bounds[0] == 0 and h.bounds[-1] <= 4)
+    assert(util.Histogram(4).merge(h).nonfinite == 4)
+
+    single = util.Histogram(4).add([5, 5])
+    assert(single.counts.sum() == 2 and single.bounds[0] == 5)
+    single.add([6])
+    assert(single.counts.sum() == 3 and single.bounds[-1] >= 6)
+
+  def test_importance_sample(self):
+    dist = np.random.randn(2000)
+    exact = util.importance_sample(dist, 10, cache=False)
+    assert(exact.shape == (10,) and np.all(np.diff(exact) > 0))
+    binned = util.importance_sample(dist, 10, method='binned', grid_size=50)
+    assert(np.abs(binned - exact).max() < 0.05)
+    fine = util.importance_sample(dist, 10, method='binned')
+    assert(np.abs(fine - exact).max() < 0.3)
+
+    # the density is cached by content
+    util._density_cache.clear()
+    util.importance_sample(dist, 10)
+    assert(len(util._density_cache) == 1)
+    assert_equal(util.importance_sample(dist.copy(), 10), exact)
+    assert(len(util._density_cache) == 1)
+    util.importance_sample(dist, 5, method='binned')
+    assert(len(util._density_cache) == 2)
+
+    assert_equal(util.importance_sample(np.ones(10), 3, method='binned'), [1, 1, 1])
+    self.assertRaises(ValueError, util.importance_sample, dist, 3, method='spline')
+
+  def test_cartesian(self):
+    arrays = ([1, 2, 3], [4, 5], [6, 7])
+    expected = np.array(list(itertools.product(*arrays)))
+    assert_equal(util.cartesian(arrays), expected)
+    out = np.zeros((12, 4), dtype=int)
+    util.cartesian(arrays, out=out[:, 1:])
+    assert_equal(out[:, 1:], expected)
+    assert(util.cartesian(([1, 2], [])).shape == (0, 2))
+
+    assert(util.cartesian_size(arrays) == 12)
+    assert_equal(util.cartesian_rows(arrays, [0, 5, 11]), expected[[0, 5, 11]])
+    assert_equal(util.cartesian_rows(arrays, 7), expected[[7]])
+
+    chunks = list(util.iter_cartesian(arrays, chunk_size=5))
+    assert([len(c) for c in chunks] == [5, 5, 2])
+    assert_equal(np.vstack(chunks), expected)
+    parts = [np.vstack(util.iter_cartesian(arrays, 2, part, 5)) for part in range(5)]
+    assert_equal(np.vstack(parts), expected)
+
+    # rows of a product far too large to materialize
+    big = [np.arange(1000)] * 4
+    assert_equal(util.cartesian_rows(big, 10 ** 12 - 1), [[999] * 4])
+    assert_equal(next(util.iter_cartesian(big, 3, 1, 2)),
+                 [[500, 0, 0, 0], [500, 0, 0, 1], [500, 0, 0, 2]])
+
+  def test_run_commands(self):
+    results = util.run_commands(
+      ['echo out', 'echo err >&2; exit 3', 'sleep 5', 'sleep 0.3; echo done'],
+      num_workers=4, timeout=1)
+    assert([r['returncode'] for r in results][:2] == [0, 3])
+    assert(results[0]['stdout'] == 'out\n' and results[1]['stderr'] == 'err\n')
+    assert(results[2]['timed_out'] and results[2]['returncode'] < 0)
+    assert(results[2]['duration'] < 4)
+    assert(results[3]['stdout'] == 'done\n' and not results[3]['timed_out'])
+
+    # commands run concurrently
+    t = time.time()
+    results = util.run_commands(['sleep 0.3'] * 4, num_workers=4, loud=True)
+    assert(time.time() - t < 1.)
+    assert(all(r['returncode'] == 0 and r['duration'] >= 0.3 for r in results))
+
+    # fail_fast kills the running commands and skips the rest
+    t = time.time()
+    results = util.run_commands(['sleep 0.1; exit 1', 'sleep 5', 'echo a', 'echo b'],
+                                num_workers=2, fail_fast=True)
+    assert(time.time() - t < 4)
+    assert(results[0]['returncode'] == 1 and results[1]['returncode'] < 0)
+    assert(results[3]['returncode'] is None)
+
+    assert(util.run_commands([]) == [])
+
   def test_determine_bin(self):
     values = np.array([0, 0.05,0.073,0.0234,0.1,0.13423,0.123534,0.1253,0.212,0.2252,0.43,0.3]).astype(float)
     bounds = np.array([0,0.1,0.2,0.3,np.max(values)])    
@@ -97,10 +326,44 @@ class Basic(unittest.TestCase):
     bins_gt = np.array([0,0,0,0,1,1,1,1,2,2,3,3])  
     assert_equal(bins, bins_gt)
 
+  def test_determine_bin_values(self):
+    values = np.array([-1, 0, 0.5, 1, 2.5, 3, 4, np.nan])
+    bounds = np.array([0., 1, 2, 4])
+    assert_equal(util.determine_bin(values, bounds), [0, 0, 0, 1, 2, 2, 2, 2])
+    centers = util.determine_bin(values, bounds, asInt=False)
+    assert(centers.shape == (8, 1))
+    assert_equal(centers[:, 0], [0.5, 0.5, 0.5, 1.5, 3, 3, 3, 3])
+
   def test_histogram(self):
     data = np.random.randint(0,10,(5000,)) 
     assert_almost_equal(util.histogram(data, 5), np.tile(1000, (1,5)),-2)  
 
+    data = np.array([0, 1, 1, 2, 3, 3, 3, 4.])
+    h = util.histogram(data, 2)
+    assert(isinstance(h, np.matrix) and h.shape == (1, 2))
+    assert_equal(h, [[3, 5]])
+    assert_equal(util.histogram(data, 2, normalize=True), [[3 / 8., 5 / 8.]])
+    assert_equal(util.histogram(data, 2, weights=data), [[2, 15]])
+    assert_equal(util.histogram_just_count(np.array([[0, 1], [1, 7]]), 3), [[1, 2, 0]])
+
+  def test_histogram_2d_and_chunks(self):
+    x = np.random.rand(1000)
+    y = np.random.rand(1000)
+    w = np.random.rand(1000)
+    bounds = np.linspace(0, 1, 6)
+    y_bounds = np.linspace(0, 1, 4)
+    h = util.histogram2d(x, y, bounds, y_bounds, w)
+    expected, _, _ = np.histogram2d(x, y, [bounds, y_bounds], weights=w)
+    assert_almost_equal(h, expected)
+
+    chunks = [x[i:i + 300] for i in range(0, 1000, 300)]
+    assert_equal(util.histogram_chunks(chunks, bounds), util.bin_counts(x, bounds))
+    chunks = [(x[i:i + 300], w[i:i + 300]) for i in range(0, 1000, 300)]
+    assert_almost_equal(util.histogram_chunks(chunks, bounds),
+                        np.histogram(x, bounds, weights=w)[0])
+    chunks = [(x[i:i + 300], y[i:i + 300], w[i:i + 300]) for i in range(0, 1000, 300)]
+    assert_almost_equal(util.histogram_chunks(chunks, bounds, y_bounds), expected)
+
 if __name__ == '__main__':
   unittest.main()
   
\ No newline at end of file